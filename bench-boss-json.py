@@ -0,0 +1,171 @@
+#!/usr/bin/env nix-shell
+#! nix-shell -i python3 -p python3 python3Packages.XlsxWriter python3Packages.numpy python3Packages.pyyaml
+
+# Times each stage of parse-boss-json.py on synthetic guilds from
+# gen-asgard-json.py and writes the results as JSON, so runs from two
+# versions can be compared with --compare.
+
+import json
+import argparse
+import os
+import time
+import tempfile
+import tracemalloc
+import resource
+import subprocess
+import platform
+from datetime import datetime
+import parse_boss_json
+import gen_asgard_json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--scales', type=str, help='comma separated MEMBERSxMATCHESxWEEKS guild sizes to benchmark', default='30x5x4,100x5x26,300x10x52')
+parser.add_argument('--output', type=str, help='file to write benchmark results JSON to', default='bench-results.json')
+parser.add_argument('--compare', type=str, help='earlier benchmark results JSON to compare against')
+parser.add_argument('--work_dir', type=str, help='directory for generated data and reports, a temporary one by default')
+parser.add_argument('--no_memory', action='store_true', help='skip tracemalloc, which slows down the timed stages')
+parser.add_argument('--heroes_file', type=str, help='file containing hero and pet data', default=os.path.join(SCRIPT_DIR, 'data/heroes.yaml'))
+parser.add_argument('--buff_file', type=str, help='file containing buff data', default=os.path.join(SCRIPT_DIR, 'data/asgard-buffs.yaml'))
+parser.add_argument('--boss_file', type=str, help='file containing the boss stats teams are checked against', default=os.path.join(SCRIPT_DIR, 'data/asgard-boss.yaml'))
+parser.add_argument('--workers', type=int, help='worker processes for the team recommendations', default=os.cpu_count())
+parser.add_argument('--seed', type=int, help='random seed for the generated data', default=0)
+
+
+def measure(stages, stage, fn, *args, **kwargs):
+    """
+    Run one stage, recording wall time and, when tracemalloc is on, the peak
+    memory allocated on top of what was live before it started.
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    ret = fn(*args, **kwargs)
+    stats = { "seconds": time.perf_counter() - start }
+    if tracemalloc.is_tracing():
+        stats["peak_bytes"] = tracemalloc.get_traced_memory()[1] - before
+    stages[stage] = stats
+    return ret
+
+def parse_scale(scale):
+    members, matches_per_member, weeks = map(int, scale.split("x"))
+    return members, matches_per_member, weeks
+
+def run_scale(scale, args, work_dir):
+    members, matches_per_member, weeks = parse_scale(scale)
+    data_dir = os.path.join(work_dir, scale)
+    cache_dir = os.path.join(data_dir, "cache")
+    gen_args = gen_asgard_json.parser.parse_args([
+        "--output_dir", data_dir,
+        "--members", str(members),
+        "--matches_per_member", str(matches_per_member),
+        "--weeks", str(weeks),
+        "--heroes_file", args.heroes_file,
+        "--buff_file", args.buff_file,
+        "--seed", str(args.seed)])
+    print(f"Generating {scale}")
+    history_files = gen_asgard_json.generate(gen_args)
+
+    print(f"Benchmarking {scale}")
+    stages = {}
+    p = parse_boss_json
+    asgard_data = measure(stages, "read_asgard_data_json", p.read_asgard_data_json, history_files[-1])
+    with open(os.path.join(data_dir, "guild.json")) as f:
+        guild_roster = measure(stages, "guild_roster", p.GuildRoster, json.load(f))
+    with open(args.heroes_file) as f:
+        hero_data = measure(stages, "heroes_yaml", p.yaml.safe_load, f)
+    with open(args.buff_file) as f:
+        buff_data = measure(stages, "buff_yaml", lambda f: p.compile_buff_data(p.yaml.safe_load(f)), f)
+    with open(args.boss_file) as f:
+        boss_data = p.yaml.safe_load(f)
+    rollup_file = os.path.join(cache_dir, "history-rollup.json")
+    deduped_history = measure(stages, "dedup_history_cold", p.dedup_history, history_files, cache_dir)
+    measure(stages, "dedup_history_warm", p.dedup_history, history_files, cache_dir)
+    measure(stages, "history_rollup_cold", p.build_history_rollup, deduped_history, rollup_file, cache_dir)
+    history_rollup = measure(stages, "history_rollup_warm", p.build_history_rollup, deduped_history, rollup_file, cache_dir)
+    week_damages_file = os.path.join(cache_dir, "history-week-damages.npz")
+    measure(stages, "week_damages_cold", p.build_week_damages, deduped_history, week_damages_file, cache_dir)
+    week_damages = measure(stages, "week_damages_warm", p.build_week_damages, deduped_history, week_damages_file, cache_dir)
+    history_tables = measure(stages, "history_tables", lambda: list(p.load_history_weeks(deduped_history, cache_dir)))
+    history = measure(stages, "compact_history", p.compact_history, history_tables)
+    hero_attribution = measure(stages, "fit_hero_attribution", p.fit_hero_attribution, history, hero_data)
+    team_synergy = measure(stages, "fit_team_synergy", p.fit_team_synergy, history, hero_attribution)
+
+    timestamp, summary_data, minion_matches, boss_matches = asgard_data
+    match_table = measure(stages, "extract_match_table", p.extract_match_table, p.iter_boss_matches(boss_matches))
+    workbook = p.open_report(os.path.join(data_dir, "Asgard-bench"), "xlsx")
+    measure(stages, "add_damage_summaries_page", p.add_damage_summaries_page, workbook, summary_data, match_table, guild_roster)
+    measure(stages, "add_match_detail_page", p.add_match_detail_page, workbook, match_table, guild_roster, hero_data)
+    measure(stages, "add_buff_summary_page", p.add_buff_summary_page, workbook, match_table, guild_roster, hero_data, buff_data)
+    measure(stages, "add_hero_summary_page", p.add_hero_summary_page, workbook, match_table, hero_data)
+    measure(stages, "add_team_summary_page", p.add_team_summary_page, workbook, match_table, guild_roster, hero_data, buff_data, boss_data)
+    measure(stages, "add_roster_teams_page", p.add_roster_teams_page, workbook, match_table, guild_roster, hero_data, boss_data)
+    measure(stages, "add_team_recommendation_page", p.add_team_recommendation_page, workbook, match_table, guild_roster, hero_data, hero_attribution, team_synergy, args.workers)
+    measure(stages, "add_history_summary_page", p.add_history_summary_page, workbook, history_rollup, guild_roster)
+    measure(stages, "add_player_trends_page", p.add_player_trends_page, workbook, week_damages, guild_roster)
+    measure(stages, "add_leaderboard_page", p.add_leaderboard_page, workbook, history, guild_roster, hero_data)
+    measure(stages, "add_hero_attribution_page", p.add_hero_attribution_page, workbook, hero_attribution, hero_data)
+    measure(stages, "workbook_close", workbook.close)
+    return {
+        "scale": scale,
+        "members": members,
+        "matches_per_member": matches_per_member,
+        "weeks": weeks,
+        "num_matches": len(match_table["match_id"]),
+        "num_history_matches": sum(len(table["match_id"]) for table in history_tables),
+        "history_table_bytes": sum(sum(column.nbytes for column in table.values()) for table in history_tables),
+        "compact_history_bytes": p.history_nbytes(history),
+        "stages": stages,
+        "total_seconds": sum(stats["seconds"] for stats in stages.values()),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(previous, current):
+    previous_runs = { run["scale"]: run for run in previous["runs"] }
+    print(f"Compared to {previous.get('revision')} from {previous.get('created')}:")
+    for run in current["runs"]:
+        old_run = previous_runs.get(run["scale"])
+        if old_run is None:
+            continue
+        print(f"  {run['scale']}")
+        for stage, stats in run["stages"].items():
+            old_stats = old_run["stages"].get(stage)
+            if old_stats is None or old_stats["seconds"] == 0:
+                continue
+            print(f"    {stage:<28} {old_stats['seconds']:9.4f}s -> {stats['seconds']:9.4f}s  x{stats['seconds'] / old_stats['seconds']:.2f}")
+
+def main():
+    args = parser.parse_args()
+    if not args.no_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        runs = [run_scale(scale, args, work_dir) for scale in args.scales.split(",")]
+    results = {
+        "revision": git_revision(),
+        "created": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "tracemalloc": not args.no_memory,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for run in runs:
+        print(f"{run['scale']}: {run['num_matches']} matches, {run['num_history_matches']} in history ({run['history_table_bytes'] / 2**20:.1f} MiB, {run['compact_history_bytes'] / 2**20:.1f} MiB compact), {run['total_seconds']:.2f}s")
+        for stage, stats in run["stages"].items():
+            peak = f"  {stats['peak_bytes'] / 2**20:8.1f} MiB" if "peak_bytes" in stats else ""
+            print(f"  {stage:<28} {stats['seconds']:9.4f}s{peak}")
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+#!/usr/bin/env nix-shell
+#! nix-shell -i python3 -p python3 python3Packages.pyyaml
+
+# The code is in gen_asgard_json.py, so bench-boss-json.py can import it.
+from gen_asgard_json import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Writes synthetic Asgard dumps and a matching guild file in the shape
+# parse-boss-json.py reads, for benchmarking at larger guild sizes and
+# longer histories than the real data/asgard-*.json samples.
+
+import json
+import random
+import argparse
+import os
+import yaml
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--output_dir', type=str, help='directory to write asgard-*.json and guild.json into', default='synthetic')
+parser.add_argument('--members', type=int, help='number of guild members', default=30)
+parser.add_argument('--matches_per_member', type=int, help='boss matches per member per week', default=5)
+parser.add_argument('--weeks', type=int, help='number of weekly dumps', default=4)
+parser.add_argument('--roster_size', type=int, help='heroes owned by each member', default=30)
+parser.add_argument('--buff_probability', type=float, help='chance that a member bought each buff in a given week', default=0.5)
+parser.add_argument('--heroes_file', type=str, help='file containing hero and pet data', default='data/heroes.yaml')
+parser.add_argument('--buff_file', type=str, help='file containing buff data', default='data/asgard-buffs.yaml')
+parser.add_argument('--seed', type=int, help='random seed', default=0)
+
+BOSS_DIFFICULTIES = [65, 75, 85, 95, 105, 115, 125, 130, 140, 150, 160]
+PET_ID_START = 6000
+FIRST_WEEK = datetime(2021, 11, 28)
+FIRST_PLAYER_ID = 10000000
+
+def make_guild(rng, num_members):
+    """
+    Same layout as data/guild.json: the clan response first, online status second.
+    """
+    members = {}
+    for i in range(num_members):
+        player_id = str(FIRST_PLAYER_ID + i)
+        members[player_id] = {
+            "id": player_id,
+            "name": f"Player {i}",
+            "level": "130",
+            "clanRole": "255" if i == 0 else rng.choice(["2", "4"]),
+        }
+    return {
+        "date": FIRST_WEEK.timestamp(),
+        "results": [
+            { "ident": "group_0_body", "result": { "response": { "clan": { "id": "1", "title": "Synthetic", "members": members } } } },
+            { "ident": "group_1_body", "result": { "response": { player_id: { "online": False } for player_id in members } } },
+        ]
+    }
+
+def make_hero(rng, hero_id, num_pets):
+    hero = {
+        "id": hero_id,
+        "level": 130,
+        "color": rng.randint(8, 18),
+        "star": rng.randint(4, 6),
+        "power": rng.randint(20000, 110000),
+        "type": "hero",
+        "hp": round(rng.uniform(8000, 100000), 1),
+        "strength": rng.randint(1500, 3000),
+        "agility": rng.randint(1000, 12000),
+        "intelligence": rng.randint(2000, 6500),
+        "physicalAttack": round(rng.uniform(50, 25000), 2),
+        "magicPower": round(rng.uniform(800, 25000), 1),
+        "armor": round(rng.uniform(500, 5000), 1),
+        "magicResist": rng.randint(1000, 5000),
+    }
+    # Penetration is simply left out when it is zero, like in the real dumps
+    kind = rng.random()
+    if kind < 0.4:
+        hero["armorPenetration"] = round(rng.uniform(1000, 30000), 1)
+    elif kind < 0.7:
+        hero["magicPenetration"] = round(rng.uniform(1000, 30000), 1)
+    if rng.random() < 0.8:
+        hero["favorPetId"] = PET_ID_START + rng.randrange(num_pets)
+        hero["favorPower"] = rng.randint(500, 6000)
+    else:
+        hero["favorPetId"] = 0
+        hero["favorPower"] = 0
+    return hero
+
+def make_buffs(rng, buff_data, buff_probability):
+    buffs = { "percentDamageBuff_any": round(rng.uniform(0, 20), 3) }
+    for buff_id, buff in buff_data.items():
+        if buff_id in buffs or rng.random() >= buff_probability:
+            continue
+        if type(buff) == str or buff.get("size") is None:
+            buffs[buff_id] = rng.randint(1, 30)
+        else:
+            buffs[buff_id] = buff["size"] * rng.randint(1, 5)
+    return buffs
+
+def make_match(rng, player_id, match_id, start_time, team, pet, buffs, difficulty, hero_weights):
+    attackers = { str(hero["id"]): hero for hero in team }
+    if pet is not None:
+        attackers[str(pet["id"])] = pet
+    damage = sum(hero["power"] * hero_weights[hero["id"]] for hero in team) * rng.uniform(0.7, 1.3)
+    damage_taken = int(damage)
+    damage_taken_next_level = int(damage * rng.uniform(0.1, 0.5)) if rng.random() < 0.1 else 0
+    return {
+        "userId": player_id,
+        "typeId": "11001",
+        "attackers": attackers,
+        "defenders": [{ "1": { "id": 2015, "level": difficulty, "type": "hero" } }],
+        "effects": { "attackers": buffs, "battleConfig": "clan_pvp" },
+        "reward": [],
+        "startTime": str(start_time),
+        "seed": str(rng.getrandbits(32)),
+        "type": "clan_raid",
+        "id": match_id,
+        "progress": [{
+            "defenders": {
+                "input": [],
+                "heroes": {
+                    "1": { "hp": 1, "energy": 0, "isDead": False, "extra": { "damageTaken": damage_taken, "damageTakenNextLevel": damage_taken_next_level } },
+                }
+            }
+        }],
+        "endTime": str(start_time),
+        "result": {
+            "win": False,
+            "stars": 0,
+            "damage": { "1": damage_taken, "2": damage_taken_next_level },
+            "raidId": "1",
+            "level": str(difficulty)
+        }
+    }
+
+def make_week(rng, week_idx, player_ids, rosters, pets, hero_weights, buff_data, args):
+    week_start = FIRST_WEEK + timedelta(weeks=week_idx)
+    summary = {}
+    boss_matches = {}
+    for player_id in player_ids:
+        roster = rosters[player_id]
+        # Heroes get a little stronger every week
+        for hero in roster:
+            hero["power"] = int(hero["power"] * rng.uniform(1.0, 1.02))
+        buffs = make_buffs(rng, buff_data, args.buff_probability)
+        difficulty = rng.choice(BOSS_DIFFICULTIES)
+        matches = {}
+        total_damage = 0
+        for match_idx in range(args.matches_per_member):
+            start_time = int((week_start + timedelta(hours=rng.randint(0, 6 * 24))).timestamp())
+            match_id = f"{start_time}{rng.randrange(10**9):09d}"
+            team = rng.sample(roster, 5)
+            pet = pets[player_id] if rng.random() < 0.98 else None
+            match = make_match(rng, player_id, match_id, start_time, team, pet, buffs, difficulty, hero_weights)
+            total_damage += match["result"]["damage"]["1"] + match["result"]["damage"]["2"]
+            matches[match_id] = match
+        boss_matches[player_id] = matches
+        summary[player_id] = {
+            "bossDamage": str(total_damage),
+            "nodesPoints": str(rng.randint(200, 550)),
+            "nodesAttemptsSpent": 9,
+            "bossAttemptsSpent": args.matches_per_member,
+        }
+    return {
+        "date": (week_start + timedelta(days=6)).timestamp(),
+        "results": [
+            { "ident": "group_0_body", "result": { "response": summary } },
+            { "ident": "group_1_body", "result": { "response": {} } },
+            { "ident": "group_2_body", "result": { "response": boss_matches } },
+        ]
+    }
+
+def generate(args):
+    rng = random.Random(args.seed)
+    with open(args.heroes_file) as f:
+        hero_data = yaml.safe_load(f)
+    with open(args.buff_file) as f:
+        buff_data = yaml.safe_load(f)
+    num_heroes = len(hero_data["heroes"])
+    num_pets = len(hero_data["pets"])
+    hero_weights = { hero_id: rng.uniform(0.5, 3.0) for hero_id in range(1, num_heroes) }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    guild = make_guild(rng, args.members)
+    with open(os.path.join(args.output_dir, "guild.json"), "w") as f:
+        json.dump(guild, f, indent="\t")
+    player_ids = list(guild["results"][0]["result"]["response"]["clan"]["members"].keys())
+    rosters = {}
+    pets = {}
+    for player_id in player_ids:
+        hero_ids = rng.sample(range(1, num_heroes), min(args.roster_size, num_heroes - 1))
+        rosters[player_id] = [make_hero(rng, hero_id, num_pets) for hero_id in hero_ids]
+        pets[player_id] = { "id": PET_ID_START + rng.randrange(num_pets), "color": rng.randint(4, 10), "level": 130, "power": rng.randint(20000, 100000), "type": "pet", "name": None }
+
+    filenames = []
+    for week_idx in range(args.weeks):
+        week = make_week(rng, week_idx, player_ids, rosters, pets, hero_weights, buff_data, args)
+        filename = os.path.join(args.output_dir, (FIRST_WEEK + timedelta(weeks=week_idx)).strftime("asgard-%Y-%m-%d.json"))
+        with open(filename, "w") as f:
+            json.dump(week, f, indent="\t")
+        filenames.append(filename)
+    return filenames
+
+def main():
+    args = parser.parse_args()
+    for filename in generate(args):
+        print(filename)
+
+if __name__ == "__main__":
+    main()
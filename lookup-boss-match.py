@@ -0,0 +1,43 @@
+#!/usr/bin/env nix-shell
+#! nix-shell -i python3 -p python3 python3Packages.numpy python3Packages.pyyaml
+
+# Prints single boss matches out of the Asgard dumps without loading the
+# dumps whole, e.g. the replay linked from a row of Boss Match Detail:
+#
+#   ./lookup-boss-match.py 'https://hero-wars.com?replay_id=1638051586123456789'
+
+import json
+import sys
+import glob
+import argparse
+import parse_boss_json
+
+parser = argparse.ArgumentParser()
+parser.add_argument('match_ids', type=str, nargs='+', help='match ids or replay links to look up')
+parser.add_argument('--history_format', type=str, help='file glob of the Asgard files to look in', default='data/asgard-*.json')
+parser.add_argument('--guild_file', type=str, help='file containing guild data JSON, for player names', default='data/guild.json')
+parser.add_argument('--cache_dir', type=str, help='directory holding the match index of each Asgard file', default='cache')
+
+REPLAY_LINK_PREFIX = "replay_id="
+
+
+def main():
+    args = parser.parse_args()
+    with open(args.guild_file) as f:
+        guild_roster = parse_boss_json.GuildRoster(json.load(f))
+    match_index = parse_boss_json.MatchIndex(sorted(glob.glob(args.history_format)), args.cache_dir)
+    missing = False
+    for match_id in args.match_ids:
+        match_id = match_id.rpartition(REPLAY_LINK_PREFIX)[2]
+        found = match_index.lookup(match_id)
+        if found is None:
+            print(f"No match {match_id} in {args.history_format}", file=sys.stderr)
+            missing = True
+            continue
+        found["player"] = guild_roster.name(str(found["player_id"]))
+        print(json.dumps(found, indent="\t"))
+    match_index.close()
+    sys.exit(1 if missing else 0)
+
+if __name__ == "__main__":
+    main()
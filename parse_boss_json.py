@@ -0,0 +1,3214 @@
+import json 
+import itertools
+from datetime import datetime
+import argparse
+import math
+import glob
+import sys
+import pickle
+import importlib.util
+import re
+import os
+import hashlib
+import contextlib
+import functools
+import time
+import threading
+import collections
+#import torch
+
+def lazy_import(name):
+    """
+    A module that is only really imported the first time one of its
+    attributes is used, so --help and runs whose pages don't need it don't
+    pay for importing it. Like import, a dotted name returns the top package
+    with the module set on its parent.
+    """
+    top = name.partition(".")[0]
+    if name in sys.modules:
+        return sys.modules[top]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return sys.modules[top]
+
+numpy = lazy_import("numpy")
+xlsxwriter = lazy_import("xlsxwriter")
+yaml = lazy_import("yaml")
+tempfile = lazy_import("tempfile")
+csv = lazy_import("csv")
+html = lazy_import("html")
+mmap = lazy_import("mmap")
+sqlite3 = lazy_import("sqlite3")
+tracemalloc = lazy_import("tracemalloc")
+concurrent = lazy_import("concurrent.futures")
+
+OUTPUT_FORMATS = ["xlsx", "csv", "jsonl"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument('asgard_file', type=str, nargs='?', help='file containing JSON to convert to spreadsheet')
+parser.add_argument('--guild_file', type=str, help='file containing guild data JSON', default='data/guild.json')
+parser.add_argument('--heroes_file', type=str, help='file containing hero and pet data', default='data/heroes.yaml')
+parser.add_argument('--buff_file', type=str, help='file containing buff data', default='data/asgard-buffs.yaml')
+parser.add_argument('--boss_file', type=str, help='file containing the boss stats teams are checked against', default='data/asgard-boss.yaml')
+parser.add_argument('--history_format', type=str, help='file glob template to compute historical data over', default='data/asgard-*.json')
+parser.add_argument('--cache_dir', type=str, help='directory holding the parsed match table of each history file', default='cache')
+parser.add_argument('--rollup_file', type=str, help='file holding the per-player history rollup', default='cache/history-rollup.json')
+parser.add_argument('--week_damages_file', type=str, help='file holding every player\'s damage in each history week, for the trends page', default='cache/history-week-damages.npz')
+parser.add_argument('--rebuild_history', action='store_true', help='recompute the history rollup from every history file instead of only new ones')
+parser.add_argument('--attribution_ridge', type=float, help='ridge penalty of the hero damage attribution fit, relative to typical hero power', default=0.1)
+parser.add_argument('--attribution_bootstrap', type=int, help='number of bootstrap replicates for the hero damage attribution confidence intervals', default=1000)
+parser.add_argument('--store', type=str, help='SQLite match store to ingest the Asgard files into and read the match and history tables back from')
+parser.add_argument('--output_dir', type=str, help='directory to write reports into', default='.')
+parser.add_argument('--output_format', type=str, choices=OUTPUT_FORMATS, help='write an xlsx workbook, or a directory with one csv or jsonl file per page', default='xlsx')
+parser.add_argument('--watch', action='store_true', help='keep running, rebuilding the report of every history file that is added or changed')
+parser.add_argument('--watch_interval', type=float, help='seconds between polls of the history files in --watch mode', default=1.0)
+parser.add_argument('--pages', type=str, help='comma separated pages to build, out of summaries,detail,buffs,heroes,teams,rosters,recommend,history,trends,leaderboards,attribution', default='summaries,detail,buffs,heroes,teams,rosters,recommend,history,trends,leaderboards,attribution')
+parser.add_argument('--serve', type=int, nargs='?', const=8000, help='serve the pages of every history file as HTML and JSON on this localhost port')
+parser.add_argument('--serve_threads', type=int, help='number of threads answering requests in --serve mode', default=8)
+parser.add_argument('--serve_cache_pages', type=int, help='number of rendered pages kept in memory in --serve mode', default=64)
+parser.add_argument('--profile', action='store_true', help='time each stage and count hot helper calls, writing the profile to --profile_file')
+parser.add_argument('--profile_file', type=str, help='JSON file to write the --profile results to', default='profile.json')
+parser.add_argument('--batch', type=str, help='file glob of Asgard files to each convert to a spreadsheet, in parallel')
+parser.add_argument('--guilds', type=str, help='YAML list of guild directories, each with a guild.json and asgard-*.json files, to build a report for each of in --output_dir/<guild directory name>/ and compare')
+parser.add_argument('--workers', type=int, help='number of worker processes for --batch, --guilds and the team recommendations', default=os.cpu_count())
+
+# Profiling is off unless --profile turns it on, and then collects
+# { stage: { calls, wall_seconds, cpu_seconds, peak_bytes } } and helper call counts.
+profile_stats = None
+profile_counts = None
+profile_stack = []
+
+# Hot helpers whose calls are counted under --profile
+PROFILED_HELPERS = ["lookup_buff", "get_num_buffs", "get_buff_gold", "lookup_hero", "lookup_pet", "lookup_color", "next_difficulty", "match_buffs"]
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """
+    Record wall time, CPU time and tracemalloc peak of a stage. Nested stages
+    each get their own peak without losing their parent's.
+    """
+    if profile_stats is None:
+        yield
+        return
+    if profile_stack:
+        profile_stack[-1]["peak"] = max(profile_stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    frame = { "base": tracemalloc.get_traced_memory()[0], "peak": 0 }
+    profile_stack.append(frame)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        profile_stack.pop()
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        if profile_stack:
+            profile_stack[-1]["peak"] = max(profile_stack[-1]["peak"], peak)
+        stats = profile_stats.setdefault(name, { "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_bytes": 0 })
+        stats["calls"] += 1
+        stats["wall_seconds"] += wall
+        stats["cpu_seconds"] += cpu
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak - frame["base"])
+
+def profiled(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if profile_stats is None:
+            return fn(*args, **kwargs)
+        with profile_stage(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def count_calls(fn, name):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile_counts[name] = profile_counts.get(name, 0) + 1
+        return fn(*args, **kwargs)
+    return wrapper
+
+def enable_profiling():
+    """
+    Start collecting profile_stats, and swap the hot helpers for counting
+    wrappers so the normal path pays nothing for the counts.
+    """
+    global profile_stats, profile_counts
+    profile_stats = {}
+    profile_counts = {}
+    tracemalloc.start()
+    module = globals()
+    for name in PROFILED_HELPERS:
+        module[name] = count_calls(module[name], name)
+    GuildRoster.name = count_calls(GuildRoster.name, "GuildRoster.name")
+
+def check_profile_file(profile_file):
+    """
+    Refuse to write the profile over a file that isn't an earlier profile,
+    like an Asgard dump passed by mistake.
+    """
+    if not os.path.exists(profile_file):
+        return
+    try:
+        with open(profile_file) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    if not isinstance(previous, dict) or set(previous) != { "stages", "calls" }:
+        raise Exception(f"Not overwriting {profile_file} with the profile: it isn't an earlier profile")
+
+def write_profile(profile_file):
+    check_profile_file(profile_file)
+    with open(profile_file, "w") as f:
+        json.dump({ "stages": profile_stats, "calls": profile_counts }, f, indent=2)
+    print(f"{'Stage':<32}{'Calls':>8}{'Wall s':>10}{'CPU s':>10}{'Peak MiB':>10}")
+    for name, stats in sorted(profile_stats.items(), key=lambda kv: kv[1]["wall_seconds"], reverse=True):
+        print(f"{name:<32}{stats['calls']:>8}{stats['wall_seconds']:>10.3f}{stats['cpu_seconds']:>10.3f}{stats['peak_bytes'] / 2**20:>10.1f}")
+    print(f"{'Helper':<32}{'Calls':>8}")
+    for name, calls in sorted(profile_counts.items(), key=lambda kv: kv[1], reverse=True):
+        print(f"{name:<32}{calls:>8}")
+    print(f"Profile written to {profile_file} (wall times include tracemalloc overhead)")
+
+ALL_COLORS = [
+    "NONE",
+    "W",
+    "G","G+1",
+    "B","B+1","B+2",
+    "V","V+1","V+2","V+3",
+    "O","O+1","O+2","O+3","O+4",
+    "R","R+1","R+2"
+]
+
+# Output 2: 
+
+# Response 0: Not used
+# Response 1: Summary of damage
+# Response 2: Minions - not used
+
+class GuildRoster:
+    """
+    Guild members indexed by player id, built once from guild.json.
+    {
+        results: {
+            1: {
+                result: {
+                    response: {
+                        clan: {
+                            members: {
+                                player_id: {
+                                    name:,
+                                    clanRole:,
+                                },
+                                ...
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+    """
+    def __init__(self, players_data):
+        for result in players_data["results"]:
+            response = result["result"]["response"]
+            if "clan" in response:
+                self.members = response["clan"]["members"]
+                self.title = response["clan"].get("title")
+                break
+        else:
+            raise Exception("Unable to find guild member data")
+        self.unknown_ids = set()
+
+    def _member(self, player_id):
+        member = self.members.get(player_id)
+        if member is None and player_id not in self.unknown_ids:
+            print("Unknown player: " + str(player_id))
+            self.unknown_ids.add(player_id)
+        return member
+
+    def name(self, player_id):
+        member = self._member(player_id)
+        return None if member is None else member["name"]
+
+    def role(self, player_id):
+        member = self._member(player_id)
+        return None if member is None else member["clanRole"]
+
+    def active_members(self):
+        """Yields (player_id, name) for members that currently hold a guild role."""
+        for player_id, player in self.members.items():
+            if player["clanRole"]:
+                yield player_id, player["name"]
+
+def compile_buff_data(buff_data):
+    """
+    Input:
+    {
+        "buffInternalName": "buffUserName"
+    }
+    Output: an index for lookup_buff. Buffs marked exactName go in a dict, all
+    others in a prefix trie; both remember their position in the input so the
+    first matching entry still wins.
+    {
+        exact: { name: (order, buff) },
+        prefixes: { char: { char: ..., "": (order, buff) } },
+        cache: { buff_id: buff }
+    }
+    """
+    exact = {}
+    prefixes = {}
+    for order, (buff_id_prefix, buff) in enumerate(buff_data.items()):
+        if type(buff) == str:
+            buff_name = buff
+            buff_gold = 0
+            buff_size = None
+            buff_exact_name = False
+        else:
+            (buff_name, buff_gold, buff_size, buff_exact_name) = buff["name"], int(float(buff["gold"])), buff["size"], buff.get("exactName", False)
+        entry = (order, (buff_name, buff_gold, buff_size))
+        if buff_exact_name:
+            exact.setdefault(buff_id_prefix, entry)
+        else:
+            node = prefixes
+            for char in buff_id_prefix:
+                node = node.setdefault(char, {})
+            node.setdefault("", entry)
+    return { "exact": exact, "prefixes": prefixes, "cache": {} }
+
+def lookup_buff(buff_index, buff_id):
+    """
+    Returns (buff_name, buff_gold, buff_size) for the first entry of the buff
+    file matching buff_id, or None.
+    """
+    cache = buff_index["cache"]
+    if buff_id in cache:
+        return cache[buff_id]
+    best = buff_index["exact"].get(buff_id)
+    node = buff_index["prefixes"]
+    for char in itertools.chain(buff_id, [None]):
+        entry = node.get("")
+        if entry is not None and (best is None or entry[0] < best[0]):
+            best = entry
+        node = node.get(char)
+        if node is None:
+            break
+    cache[buff_id] = ret = best[1] if best is not None else None
+    return ret
+
+def lookup_hero(hero_data, hero_id):
+    """
+    Input:
+    {
+        "heroes": {
+            "1": {
+                name: "Astaroth"
+            }
+        },
+        "pets": {
+            "2": {
+                name: "Albus
+            }
+        }
+    }
+    """
+    hero  = hero_data["heroes"][hero_id]
+    return hero
+
+def get_num_buffs(buff_data, buff_id, buff_amount):
+    buff_name, buff_gold, buff_size = lookup_buff(buff_data, buff_id)
+    if buff_size == None:
+        return 1
+    else:
+        count = math.ceil(buff_amount / buff_size)
+        assert count >= 1 and count <= 5, f"buff:{buff_name} amount:{buff_amount} size:{buff_size} count:{count}"
+        return count
+
+def get_buff_gold(buff_data, buff_id, buff_amount):
+    buff_name, buff_gold, buff_size = lookup_buff(buff_data, buff_id)
+    if buff_size == None:
+        if buff_gold > 0:
+            raise f"Buff gold is non-zero for purchasable buff: {buff_name} = {buff_gold}"
+        ret = 0
+    else:
+        ret = buff_gold * get_num_buffs(buff_data, buff_id, buff_amount)
+    #print(f"buff:{buff_name} total_amount:{buff_amount} size:{buff_size} gold:{ret}")
+    return ret
+
+PET_ID_START = 6000
+
+def lookup_pet(hero_data, pet_id):
+    """
+    Input:
+    {
+        "heros": {
+            "1": {
+                name: "Astaroth"
+            }
+        },
+        "pets": {
+            "2": {
+                name: "Albus
+            }
+        }
+    }
+    """
+    if pet_id == 0:
+        return None
+    pet_idx = pet_id - PET_ID_START
+    return hero_data["pets"][pet_idx]
+
+def lookup_week(json):
+    return json["results"][1]
+
+def lookup_color(color):
+    if color < len(ALL_COLORS):
+        return ALL_COLORS[color]
+    else:
+        raise Exception("Unknown color id " + str(color))
+
+boss_difficulties = [65, 75, 85, 95, 105, 115, 125, 130, 140, 150, 160, 160 ]
+
+def next_difficulty(difficulty):
+    return boss_difficulties[boss_difficulties.index(int(difficulty)) + 1]
+
+def iter_boss_matches(match_data):
+    """
+    Flatten an already-loaded boss match section into the same
+    (player_id, match_id, match) records that iter_asgard_matches streams.
+    """
+    for player_id, matches in match_data["result"]["response"].items():
+        for match_id, match in matches.items():
+            yield player_id, match_id, match
+
+MAX_TEAM_HEROES = 5
+PET_SLOT = MAX_TEAM_HEROES
+
+# (column, attacker key, dtype) of the fixed-width attacker block. Missing stats are 0.
+MATCH_TABLE_ATTACKER_STATS = [
+    ("hero_ids", "id", "int32"),
+    ("hero_colors", "color", "int16"),
+    ("hero_powers", "power", "int64"),
+    ("hero_hp", "hp", "float64"),
+    ("hero_strength", "strength", "float64"),
+    ("hero_magic_penetration", "magicPenetration", "float64"),
+    ("hero_armor_penetration", "armorPenetration", "float64"),
+    ("hero_favor_pet_ids", "favorPetId", "int32"),
+    ("hero_favor_powers", "favorPower", "int64"),
+]
+
+@profiled
+def extract_match_table(match_records):
+    """
+    Single pass over boss match records into the match table every page reads
+    from: numpy columns with one row per match. Attackers are a fixed-width
+    block of 5 heroes in attacker order followed by the pet, with id 0 for an
+    empty slot. Buffs keep their in-match order as indexes into buff_names,
+    padded with -1.
+    Input:
+    {
+        result:
+        {
+            response: {
+                $PLAYER_ID: {
+                    $MATCH_ID: {
+                        attackers: {
+                            $HERO_ID: { power, color, hp, magicPenetration, armorPenetration, favorPetId, favorPower }
+                        },
+                        defenders: { "1": { level, ...}},
+                        effects: [ $effectName: number ],
+                        startTime: "1637585752",
+                        result: {
+                            damage: { "1": $CURRENT_BOSS, "2": $NEXT_BOSS}],
+                            progress: [
+                                {
+                                    defenders: {
+                                        heroes: {
+                                            hero_id: {
+                                                extra: {
+                                                    damageTaken:,
+                                                    damageTakenNextLevel
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            ]
+                            }
+                    },
+                    ...
+    }}}}
+    Output:
+    {
+        player_id: [n], match_id: [n], start_time: [n], level: [n],
+        damage_taken: [n], damage_taken_next_level: [n],
+        hero_ids: [n, 6], hero_colors: [n, 6], hero_powers: [n, 6], ...,
+        buff_names: [k], buff_slots: [n, m], buff_values: [n, m]
+    }
+    """
+    rows = []
+    attacker_rows = { column: [] for column, _, _ in MATCH_TABLE_ATTACKER_STATS }
+    buff_rows = []
+    buff_idxs = {}
+    for player_id, match_id, match in match_records:
+        bossProgress = list(match["progress"][0]["defenders"]["heroes"].values())[0]["extra"]
+        team = [None] * (MAX_TEAM_HEROES + 1)
+        hero_slot = 0
+        for attacker in match["attackers"].values():
+            if attacker["type"] == "pet":
+                team[PET_SLOT] = attacker
+            elif attacker["type"] == "hero":
+                if hero_slot == MAX_TEAM_HEROES:
+                    raise Exception(f"Match {match_id} of player {player_id}: team has more than {MAX_TEAM_HEROES} heroes")
+                team[hero_slot] = attacker
+                hero_slot += 1
+            else:
+                raise Exception("Unknown hero type: " + attacker["type"])
+        for column, key, _ in MATCH_TABLE_ATTACKER_STATS:
+            attacker_rows[column].append([0 if attacker is None else attacker.get(key, 0) for attacker in team])
+        buff_rows.append([(buff_idxs.setdefault(buff_id, len(buff_idxs)), amount) for buff_id, amount in match["effects"]["attackers"].items()])
+        rows.append((
+            int(player_id),
+            int(match_id),
+            int(match["startTime"]),
+            int(match["result"]["level"]),
+            int(bossProgress["damageTaken"]),
+            int(bossProgress["damageTakenNextLevel"]),
+        ))
+    max_buffs = max(map(len, buff_rows), default=0)
+    buff_slots = numpy.full((len(buff_rows), max_buffs), -1, dtype=numpy.int16)
+    buff_values = numpy.zeros((len(buff_rows), max_buffs), dtype=numpy.float64)
+    for row_idx, buffs in enumerate(buff_rows):
+        for slot, (buff_idx, amount) in enumerate(buffs):
+            buff_slots[row_idx, slot] = buff_idx
+            buff_values[row_idx, slot] = amount
+    match_table = {}
+    for col_idx, (column, dtype) in enumerate([
+            ("player_id", "int64"),
+            ("match_id", "int64"),
+            ("start_time", "int64"),
+            ("level", "int32"),
+            ("damage_taken", "int64"),
+            ("damage_taken_next_level", "int64")]):
+        match_table[column] = numpy.array([row[col_idx] for row in rows], dtype=dtype)
+    for column, _, dtype in MATCH_TABLE_ATTACKER_STATS:
+        match_table[column] = numpy.array(attacker_rows[column], dtype=dtype).reshape(-1, MAX_TEAM_HEROES + 1)
+    match_table["buff_names"] = numpy.array(list(buff_idxs.keys()), dtype=str)
+    match_table["buff_slots"] = buff_slots
+    match_table["buff_values"] = buff_values
+    return match_table
+
+def match_total_damages(match_table):
+    return match_table["damage_taken"] + match_table["damage_taken_next_level"]
+
+def match_buffs(match_table, row):
+    """
+    The buffs of one match table row as (buff_id, amount) pairs in match order.
+    """
+    buffs = []
+    for buff_idx, amount in zip(match_table["buff_slots"][row].tolist(), match_table["buff_values"][row].tolist()):
+        if buff_idx < 0:
+            break
+        buffs.append((str(match_table["buff_names"][buff_idx]), int(amount) if amount.is_integer() else amount))
+    return buffs
+
+def boss_damage_by_player_difficulty(match_table):
+    ret = {}
+    difficulties = {}
+    for player_id, difficulty, damage_taken, damage_taken_next_level in zip(
+            match_table["player_id"].tolist(),
+            match_table["level"].tolist(),
+            match_table["damage_taken"].tolist(),
+            match_table["damage_taken_next_level"].tolist()):
+        player_id = str(player_id)
+        bossProgresses = [damage_taken, damage_taken_next_level]
+        ret.setdefault(player_id, {})
+        for progress in bossProgresses:
+            ret[player_id].setdefault(difficulty, 0.0)
+            ret[player_id][difficulty] += progress
+            difficulties[difficulty] = 1
+            difficulty = next_difficulty(difficulty)
+    return ret, sorted(difficulties.keys())
+
+@profiled
+def add_damage_summaries_page(workbook, summary_data, match_table, guild_roster):
+    """
+    Output: Player|BossDamage|Boss Attacks|Morale Points|Minion Attacks
+    Input:
+    {
+        result: {
+            response: {
+                $PLAYER_ID: {
+                    bossDamage:,
+                    nodesPoints:,
+                    nodesAttemptsSpent:,
+                    bossAttemptsSpent:
+                }
+            }
+        }
+    }
+    """
+    worksheet = workbook.add_worksheet("Player Summaries")
+    MAX_BOSS_ATTEMPTS = 5
+    MAX_MINION_ATTEMPTS = 9
+    format_error = workbook.add_format({'bold': True, 'bg_color': 'red', 'font_color': 'yellow'})
+    format_warn = workbook.add_format({'bold': True, 'bg_color': 'yellow', 'font_color': 'black'})
+    worksheet.write(0,0,"Player")
+    worksheet.write(0,1,"Boss Damage")
+    worksheet.write(0,2,"Boss Attempts")
+    worksheet.write(0,3,"Minions Points")
+    worksheet.write(0,4,"Minions Attempts")
+    sorted_stats = sorted(summary_data["result"]["response"].items(), key=lambda x: int(x[1]["bossDamage"]), reverse=True)
+    absent_players = [(pid, {}) for pid, name in guild_roster.active_members() if pid not in summary_data["result"]["response"]]
+    boss_damages, difficulties = boss_damage_by_player_difficulty(match_table)
+    for i, difficulty in enumerate(difficulties, 5):
+        worksheet.write(0,i,f"Damage to {difficulty} boss")
+    for row_id, (player_id, player_stats) in zip(itertools.count(1), sorted_stats + absent_players):
+        player_name = guild_roster.name(player_id)
+        if player_name is None:
+            worksheet.write(row_id, 0, "Unknown player: " + player_id, format_error)
+        else:
+            worksheet.write(row_id, 0, player_name)
+        worksheet.write(row_id, 1, int(player_stats.get("bossDamage", 0)))
+        bossAttemptsSpent = player_stats.get("bossAttemptsSpent", 0)
+        worksheet.write(row_id, 2, int(bossAttemptsSpent), None if bossAttemptsSpent == MAX_BOSS_ATTEMPTS else format_error)
+        nodesPoints = player_stats.get("nodesPoints")
+        worksheet.write(row_id, 3, int(nodesPoints or 0), None if nodesPoints is not None else format_error)
+        nodesAttemptsSpent = player_stats.get("nodesAttemptsSpent")
+        worksheet.write(row_id, 4, int(nodesAttemptsSpent or 0), None if nodesAttemptsSpent == MAX_MINION_ATTEMPTS else format_error)
+        player_boss_damages = boss_damages.get(player_id)
+        for i, difficulty in enumerate(difficulties, 5):
+            if player_boss_damages is None:
+                worksheet.write(row_id, i, None, format_warn)
+            else:
+                damage = player_boss_damages.get(difficulty)
+                worksheet.write(row_id, i, damage)
+
+@profiled
+def add_match_detail_page(workbook, match_table, guild_roster, hero_data):
+    """
+    Output:
+    Pet schema = Name|Color|Power
+    Hero schema = Name|Color|Power|HP|Magic Penetration|Armor Penetration|Patroned Pet's Name|Patron Pet's Patronage Power
+    Main schema = Datetime|Boss Ending Level|# of Bosses Fought|Total Damage to Boss|Damage to Boss #1|Damage to Boss #2|Hero1|Hero2|Hero3|Hero4|Hero5|Main Pet
+    Input: the match table from extract_match_table
+    """
+    worksheet = workbook.add_worksheet("Boss Match Detail")
+    format_error = workbook.add_format({'bold': True, 'bg_color': 'red', 'font_color': 'yellow'})
+    format_warning = workbook.add_format({'bold': True, 'bg_color': 'yellow', 'font_color': 'black'})
+    format_integer = workbook.add_format({'num_format': 1})
+    format_percent = workbook.add_format({'num_format': 3})
+
+    pos = [ 0 ]
+    cells = []
+    def write_column(x, format=None, canError=True):
+        cells.append((x, format_error if canError and format is None and x is None else format))
+    def finish_row():
+        col = 0
+        for format, run in itertools.groupby(cells, key=lambda cell: cell[1]):
+            values = [value for value, _ in run]
+            worksheet.write_row(pos[0], col, values, format)
+            col += len(values)
+        cells.clear()
+        pos[0] += 1
+    attackers = { column: match_table[column].tolist() for column, _, _ in MATCH_TABLE_ATTACKER_STATS }
+    def write_hero(row, slot):
+        if attackers["hero_ids"][row][slot] == 0:
+            for _ in hero_columns:
+                write_column(None)
+            return
+        hero_name = lookup_hero(hero_data, attackers["hero_ids"][row][slot])
+        write_column(hero_name, canError=True)
+        write_column(lookup_color(attackers["hero_colors"][row][slot]))
+        write_column(attackers["hero_powers"][row][slot], format_integer)
+        write_column(attackers["hero_hp"][row][slot] + 40*attackers["hero_strength"][row][slot], format_integer)
+        write_column(attackers["hero_magic_penetration"][row][slot], format=format_integer)
+        write_column(attackers["hero_armor_penetration"][row][slot], format=format_integer)
+        write_column(lookup_pet(hero_data, attackers["hero_favor_pet_ids"][row][slot]), canError=True)
+        write_column(attackers["hero_favor_powers"][row][slot], format_integer)
+
+    def write_pet(row):
+        if attackers["hero_ids"][row][PET_SLOT] == 0:
+            write_column(None, format_warning)
+            write_column(None, format_warning)
+            write_column(None, format_warning)
+        else:
+            pet_name = lookup_pet(hero_data, attackers["hero_ids"][row][PET_SLOT])
+            write_column(pet_name, format_error if pet_name is None else None)
+            write_column(lookup_color(attackers["hero_colors"][row][PET_SLOT]))
+            write_column(attackers["hero_powers"][row][PET_SLOT], format_integer)
+
+
+    matches = []
+    pet_columns = [
+        "Pet Name",
+        "Pet Color",
+        "Pet Power"
+    ]
+    hero_columns = [
+        "Hero Name",
+        "Hero Color",
+        "Hero Power",
+        "Hero HP",
+        "Hero Magic Penetration",
+        "Hero Armor Penetration",
+        "Patroned Pet Name",
+        "Pet Patron Power"
+    ]
+    columns = [
+        "Player name",
+        "Datetime",
+        "Replay Link",
+        "Boss Level at End of Fight",
+        "Number of Bosses Fought",
+        "Total Damage to Boss",
+        "Damage to Boss #1",
+        "Damage to Boss #2",
+        "Guild Morale",
+        "Buffs"
+    ] + (hero_columns * 5) + pet_columns
+    for column_name in columns:
+        write_column(column_name)
+    finish_row()
+    player_ids = match_table["player_id"].tolist()
+    match_ids = match_table["match_id"].tolist()
+    start_times = match_table["start_time"].tolist()
+    levels = match_table["level"].tolist()
+    damages_taken = match_table["damage_taken"].tolist()
+    damages_taken_next_level = match_table["damage_taken_next_level"].tolist()
+    for row in numpy.argsort(-match_total_damages(match_table), kind="stable").tolist():
+        write_column(guild_roster.name(str(player_ids[row])))
+        write_column(datetime.utcfromtimestamp(start_times[row]).isoformat())
+        write_column("https://hero-wars.com?replay_id=" + str(match_ids[row]))
+        write_column(str(levels[row]))
+        bossProgresses = [damages_taken[row], damages_taken_next_level[row]]
+        write_column(len(list(filter(lambda x: x > 0, bossProgresses))))
+        write_column(sum(bossProgresses), format_integer)
+        write_column(bossProgresses[0], format_integer)
+        write_column(bossProgresses[1], format_integer)
+        buffs = match_buffs(match_table, row)
+        write_column(dict(buffs).get("percentDamageBuff_any"), format_percent)
+        buffstrings = []
+        for k, v in buffs:
+            buffstrings.append(k + ':' + str(v))
+        write_column(','.join(buffstrings))
+        for slot in range(MAX_TEAM_HEROES):
+            write_hero(row, slot)
+        write_pet(row)
+        finish_row()
+
+@profiled
+def add_buff_summary_page(workbook, match_table, guild_roster, hero_data, buff_data):
+    worksheet = workbook.add_worksheet("Buff Summary")
+    format_error = workbook.add_format({'bold': True, 'bg_color': 'red', 'font_color': 'yellow'})
+    format_warning = workbook.add_format({'bold': True, 'bg_color': 'yellow', 'font_color': 'black'})
+    format_integer = workbook.add_format({'num_format': 1})
+    format_percent = workbook.add_format({'num_format': 3})
+
+    # Buffs are bought once per week, so each player's first match has all of them
+    first_match_buffs = {}
+    for row, player_id in enumerate(match_table["player_id"].tolist()):
+        if str(player_id) not in first_match_buffs:
+            first_match_buffs[str(player_id)] = match_buffs(match_table, row)
+    # First two columns are counts of each buff
+    counts = {}
+    for (player_id, buffs) in first_match_buffs.items():
+        for (buff_id, buff) in buffs:
+            (buff_name, _, _) = lookup_buff(buff_data, buff_id)
+            counts.setdefault(buff_id, 0)
+            counts[buff_id] += 1
+    sorted_counts = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    # Then is the buffs-by-player detail
+    buffs_by_player = {}
+    gold_by_player = {}
+    for player_id, buffs in first_match_buffs.items():
+        for buff_id, buff in buffs:
+            (buff_name, _, _) = lookup_buff(buff_data, buff_id)
+            buffs_by_player.setdefault(player_id, {}).setdefault(buff_id, 0)
+            buffs_by_player[player_id][buff_id] = buff
+            gold_by_player.setdefault(player_id, 0)
+            gold_by_player[player_id] += get_buff_gold(buff_data, buff_id, buff)
+    sorted_players = sorted(buffs_by_player.items(), key=lambda kv: guild_roster.name(kv[0]))
+    # Both tables share rows, and rows have to be written in order
+    for row in range(max(len(sorted_counts), len(sorted_players) + 1)):
+        if row < len(sorted_counts):
+            buff_id, count = sorted_counts[row]
+            (buff_name, gold, size) = lookup_buff(buff_data, buff_id)
+            worksheet.write(row, 0, buff_name or buff_id, format_warning if buff_name is None else None)
+            worksheet.write(row, 1, count, format_integer)
+        if row == 0:
+            worksheet.write_row(0, 4, ["Player", "Gold Spent"])
+            continue
+        if row > len(sorted_players):
+            continue
+        player_id, player_buffs = sorted_players[row - 1]
+        worksheet.write(row, 4, guild_roster.name(player_id))
+        worksheet.write(row, 5, gold_by_player[player_id], format_integer)
+        buff_strs = []
+        for buff_id, buff in sorted(player_buffs.items(), key= lambda kv: kv[0]):
+            (buff_name, gold, size) = lookup_buff(buff_data, buff_id)
+            num_buffs = get_num_buffs(buff_data, buff_id, buff)
+            buff_name = buff_name or buff_id
+            if num_buffs == 1:
+                buff_strs.append(buff_name)
+            else:
+                buff_strs.append(f"{buff_name}: {num_buffs}")
+        worksheet.write_row(row, 6, buff_strs)
+
+@profiled
+def add_hero_summary_page(workbook, match_table, hero_data):
+    """
+    Output: Hero|Count|Estimated Damage Weight
+    """
+
+    num_heroes = len(hero_data["heroes"]) # Includes the placeholder, but whatever.
+    num_matches = len(match_table["match_id"])
+    arr_damages = match_total_damages(match_table).astype(float)
+    arr_powers = numpy.zeros((num_matches, num_heroes), dtype=float)
+    arr_presence = numpy.zeros((num_matches, num_heroes), dtype=float)
+    arr_hero_team_damages = numpy.zeros((num_matches, num_heroes), dtype=float)
+    arr_presence[:, 0] = 1.0 # Pet is always present
+    arr_powers[:,0] = 100000 # Albus is usually present
+    hero_ids = match_table["hero_ids"][:, :MAX_TEAM_HEROES]
+    match_idxs, slots = numpy.nonzero(hero_ids)
+    hero_idxs = hero_ids[match_idxs, slots]
+    arr_counts = numpy.bincount(hero_idxs, minlength=num_heroes)
+    arr_powers[match_idxs, hero_idxs] = match_table["hero_powers"][match_idxs, slots]
+    arr_hero_team_damages[match_idxs, hero_idxs] = arr_damages[match_idxs]
+    arr_presence[match_idxs, hero_idxs] = 1.0
+    arr_hero_team_damages[:, 0] = arr_damages # Pet is always present
+    worksheet = workbook.add_worksheet("Hero Summary")
+    worksheet.write_row(0, 0, ["Hero", "Count", "Average power", "Average team damage", "Team Damage per Hero Power"])
+    format_integer = workbook.add_format({'num_format': 1})
+    rows = []
+    for hero_id in range(1, num_heroes):
+        def avg_over_nonzero(arr):
+            nonzeroes, = numpy.where(arr[:, hero_id] > 0)
+            if len(nonzeroes) > 0:
+                return numpy.mean(arr[:, hero_id], axis=0, where=arr[:, hero_id] > 0).item()
+            else:
+                return None
+        avg_power = avg_over_nonzero(arr_powers) or 1
+        avg_team_damage = avg_over_nonzero(arr_hero_team_damages) or 0
+        rows.append([
+            lookup_hero(hero_data, hero_id),
+            arr_counts[hero_id],
+            avg_power,
+            avg_team_damage,
+            avg_team_damage / avg_power
+        ])
+    rows.sort(reverse=True, key=lambda x: x[4])
+    for row_id, row in enumerate(rows, start=1):
+        worksheet.write_row(row_id, 0, row, format_integer)
+
+# Types of the hero snapshot columns in the compact history. Stats that are
+# only ever looked at, not fit on, drop to float32.
+HISTORY_SNAPSHOT_DTYPES = {
+    "hero_ids": "int16",
+    "hero_colors": "int8",
+    "hero_powers": "int32",
+    "hero_hp": "float32",
+    "hero_strength": "float32",
+    "hero_magic_penetration": "float32",
+    "hero_armor_penetration": "float32",
+    "hero_favor_pet_ids": "int16",
+    "hero_favor_powers": "int32",
+}
+
+@profiled
+def compact_history(match_tables):
+    """
+    Many weeks of match tables in the compact form the history pipeline keeps
+    in memory. Player ids and buff names are interned to small integers, and
+    an attacker's stats are stored once per player and week as a snapshot
+    that matches point to, since a hero's stats don't change within a week.
+    The same goes for the buffs a player bought for the week. Tables are
+    consumed one at a time, so only one full week is alive at once.
+    Output:
+    {
+        weeks: [w], player_ids: [p], buff_names: [k],
+        week_idx: [n], player_idx: [n], match_id: [n], level: [n], damage_taken: [n], damage_taken_next_level: [n],
+        snapshots: [n, 6] (0 for an empty slot), hero_ids: [s], hero_colors: [s], hero_powers: [s], ...,
+        buff_sets: [n], buff_set_slots: [b, m], buff_set_values: [b, m]
+    }
+    """
+    stat_columns = [column for column, _, _ in MATCH_TABLE_ATTACKER_STATS]
+    player_idxs = {}
+    buff_idxs = {}
+    weeks = []
+    columns = { column: [] for column in ["week_idx", "player_idx", "match_id", "level", "damage_taken", "damage_taken_next_level", "snapshots", "buff_sets"] }
+    # Snapshot 0 is the empty slot
+    snapshots = [numpy.zeros((1, len(stat_columns)))]
+    num_snapshots = 1
+    buff_sets = []
+    num_buff_sets = 0
+    for week_idx, match_table in enumerate(match_tables):
+        weeks.append(match_table_week(match_table))
+        num_matches = len(match_table["match_id"])
+        player_idx = numpy.array([player_idxs.setdefault(player_id, len(player_idxs)) for player_id in match_table["player_id"].tolist()], dtype=numpy.int64)
+        columns["week_idx"].append(numpy.full(num_matches, week_idx))
+        columns["player_idx"].append(player_idx)
+        for column in ["match_id", "level", "damage_taken", "damage_taken_next_level"]:
+            columns[column].append(match_table[column])
+
+        # Snapshots of this week: unique (player, stats) rows among the filled slots
+        stats = numpy.stack([match_table[column].astype(numpy.float64) for column in stat_columns], axis=-1)
+        filled = match_table["hero_ids"] != 0
+        keys = numpy.concatenate([numpy.broadcast_to(player_idx[:, None, None], filled.shape + (1,))[filled], stats[filled]], axis=1)
+        unique_keys, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+        match_snapshots = numpy.zeros(filled.shape, dtype=numpy.int64)
+        match_snapshots[filled] = num_snapshots + inverse.ravel()
+        snapshots.append(unique_keys[:, 1:])
+        num_snapshots += len(unique_keys)
+        columns["snapshots"].append(match_snapshots)
+
+        # Buff sets of this week, with buff names interned across weeks
+        week_buff_idxs = numpy.array([buff_idxs.setdefault(name, len(buff_idxs)) for name in match_table["buff_names"].tolist()] + [-1], dtype=numpy.int64)
+        buff_keys = numpy.concatenate([week_buff_idxs[match_table["buff_slots"]], match_table["buff_values"]], axis=1)
+        unique_buffs, inverse = numpy.unique(buff_keys, axis=0, return_inverse=True)
+        buff_sets.append(unique_buffs)
+        columns["buff_sets"].append(num_buff_sets + inverse.ravel())
+        num_buff_sets += len(unique_buffs)
+
+    history = {
+        "weeks": numpy.array(weeks, dtype=str),
+        "player_ids": numpy.array(list(player_idxs.keys()), dtype=numpy.int64),
+        "buff_names": numpy.array(list(buff_idxs.keys()), dtype=str),
+    }
+    for column, dtype in [("week_idx", "uint16"), ("player_idx", "uint16"), ("match_id", "int64"), ("level", "int16"), ("damage_taken", "int64"), ("damage_taken_next_level", "int64"), ("buff_sets", "uint32")]:
+        history[column] = numpy.concatenate(columns[column]).astype(dtype) if weeks else numpy.zeros(0, dtype=dtype)
+    history["snapshots"] = numpy.concatenate(columns["snapshots"]).astype(numpy.uint32) if weeks else numpy.zeros((0, MAX_TEAM_HEROES + 1), dtype=numpy.uint32)
+    snapshots = numpy.concatenate(snapshots)
+    for stat_idx, column in enumerate(stat_columns):
+        history[column] = snapshots[:, stat_idx].astype(HISTORY_SNAPSHOT_DTYPES[column])
+    # Buff sets are (slots, values) rows, padded to the longest week's width
+    max_buffs = max((buff_set.shape[1] // 2 for buff_set in buff_sets), default=0)
+    history["buff_set_slots"] = numpy.full((num_buff_sets, max_buffs), -1, dtype=numpy.int16)
+    history["buff_set_values"] = numpy.zeros((num_buff_sets, max_buffs), dtype=numpy.float32)
+    row = 0
+    for buff_set in buff_sets:
+        width = buff_set.shape[1] // 2
+        history["buff_set_slots"][row:row + len(buff_set), :width] = buff_set[:, :width]
+        history["buff_set_values"][row:row + len(buff_set), :width] = buff_set[:, width:]
+        row += len(buff_set)
+    return history
+
+def history_column(history, column):
+    """
+    An attacker column of the compact history expanded to one row per match,
+    like the match table's [n, 6] attacker block.
+    """
+    return history[column][history["snapshots"]]
+
+def history_nbytes(history):
+    return sum(array.nbytes for array in history.values())
+
+ATTRIBUTION_POWER_UNIT = 10000
+
+@profiled
+def fit_hero_attribution(history, hero_data, ridge=0.1, num_bootstrap=1000, seed=0):
+    """
+    Ridge least-squares estimate of how much boss damage each hero and pet
+    contributes per 10k of its power, with one intercept per boss difficulty,
+    fit over the matches of the compact history. A match only has 7 nonzero
+    features (5 heroes, the pet and its difficulty) out of ~80, so the design
+    matrix is kept as (column, value) pairs per row and the normal equations
+    are accumulated with bincount instead of being built densely.
+
+    Confidence intervals come from a bootstrap over player-weeks that is
+    linearized around the full fit: each replicate reweights the per-cluster
+    score vectors X'e, so a whole batch of replicates is one matrix product
+    rather than a refit each.
+    Output:
+    {
+        num_heroes:, num_pets:, levels: [d], num_matches:,
+        coefficients: [p], ci_low: [p], ci_high: [p], counts: [p]
+    }
+    """
+    num_heroes = len(hero_data["heroes"])
+    num_pets = len(hero_data["pets"])
+    hero_ids = history_column(history, "hero_ids").astype(numpy.int64)
+    powers = history_column(history, "hero_powers") / ATTRIBUTION_POWER_UNIT
+    damages = match_total_damages(history).astype(float)
+    player_ids = history["player_ids"][history["player_idx"]]
+    week_idxs = history["week_idx"].astype(numpy.int64)
+    levels, level_idxs = numpy.unique(history["level"].astype(numpy.int64), return_inverse=True)
+    num_matches = len(damages)
+    num_columns = num_heroes + num_pets + len(levels)
+
+    # Sparse rows: hero slots, pet slot, difficulty intercept. Empty or unknown attackers become (0, 0.0).
+    cols = numpy.zeros((num_matches, MAX_TEAM_HEROES + 2), dtype=numpy.int64)
+    vals = numpy.zeros((num_matches, MAX_TEAM_HEROES + 2), dtype=float)
+    heroes = hero_ids[:, :MAX_TEAM_HEROES]
+    known = (heroes > 0) & (heroes < num_heroes)
+    cols[:, :MAX_TEAM_HEROES] = numpy.where(known, heroes, 0)
+    vals[:, :MAX_TEAM_HEROES] = numpy.where(known, powers[:, :MAX_TEAM_HEROES], 0.0)
+    pet_idxs = hero_ids[:, PET_SLOT] - PET_ID_START
+    known = (pet_idxs >= 0) & (pet_idxs < num_pets)
+    cols[:, PET_SLOT] = numpy.where(known, num_heroes + pet_idxs, 0)
+    vals[:, PET_SLOT] = numpy.where(known, powers[:, PET_SLOT], 0.0)
+    cols[:, PET_SLOT + 1] = num_heroes + num_pets + level_idxs
+    vals[:, PET_SLOT + 1] = 1.0
+
+    xtx = numpy.bincount(
+        (cols[:, :, None] * num_columns + cols[:, None, :]).ravel(),
+        weights=(vals[:, :, None] * vals[:, None, :]).ravel(),
+        minlength=num_columns * num_columns).reshape(num_columns, num_columns)
+    xty = numpy.bincount(cols.ravel(), weights=(vals * damages[:, None]).ravel(), minlength=num_columns)
+    # Penalize heroes and pets relative to their typical scale; intercepts only get enough to stay invertible.
+    attacker_diagonal = numpy.diag(xtx)[:num_heroes + num_pets]
+    scale = attacker_diagonal[attacker_diagonal > 0].mean() if numpy.any(attacker_diagonal > 0) else 1.0
+    penalty = numpy.full(num_columns, 1e-9 * scale)
+    penalty[:num_heroes + num_pets] += ridge * scale
+    normal_inverse = numpy.linalg.inv(xtx + numpy.diag(penalty))
+    coefficients = normal_inverse @ xty
+
+    residuals = damages - (vals * coefficients[cols]).sum(axis=1)
+    _, cluster_idxs = numpy.unique(player_ids * len(history["weeks"]) + week_idxs, return_inverse=True)
+    num_clusters = cluster_idxs.max() + 1 if num_matches > 0 else 0
+    scores = numpy.bincount(
+        (cluster_idxs[:, None] * num_columns + cols).ravel(),
+        weights=(vals * residuals[:, None]).ravel(),
+        minlength=num_clusters * num_columns).reshape(num_clusters, num_columns)
+    rng = numpy.random.default_rng(seed)
+    replicates = []
+    for start in range(0, num_bootstrap, 100):
+        # Exponential weights have mean 1 and variance 1, like a Bayesian bootstrap.
+        weights = rng.exponential(size=(min(100, num_bootstrap - start), num_clusters)) - 1.0
+        replicates.append(coefficients + (weights @ scores) @ normal_inverse)
+    ci_low, ci_high = numpy.percentile(numpy.concatenate(replicates), [2.5, 97.5], axis=0)
+    return {
+        "num_heroes": num_heroes,
+        "num_pets": num_pets,
+        "levels": levels,
+        "num_matches": num_matches,
+        "coefficients": coefficients,
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "counts": numpy.bincount(cols.ravel(), weights=(vals.ravel() > 0), minlength=num_columns).astype(int),
+    }
+
+@profiled
+def add_hero_attribution_page(workbook, hero_attribution, hero_data):
+    """
+    Output: Hero|Matches|Damage per 10k Power|95% CI Low|95% CI High
+    Heroes and pets over the whole history, from fit_hero_attribution.
+    """
+    worksheet = workbook.add_worksheet("Hero Attribution")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Hero", "Matches", "Damage per 10k Power", "95% CI Low", "95% CI High"])
+    num_heroes = hero_attribution["num_heroes"]
+    names = [lookup_hero(hero_data, hero_id) for hero_id in range(num_heroes)] + \
+        [lookup_pet(hero_data, PET_ID_START + pet_idx) for pet_idx in range(hero_attribution["num_pets"])]
+    rows = []
+    for column, name in enumerate(names):
+        count = hero_attribution["counts"][column]
+        if column == 0 or count == 0:
+            continue
+        rows.append([
+            name,
+            count,
+            hero_attribution["coefficients"][column],
+            hero_attribution["ci_low"][column],
+            hero_attribution["ci_high"][column]
+        ])
+    rows.sort(reverse=True, key=lambda x: x[2])
+    for row_id, row in enumerate(rows, start=1):
+        worksheet.write_row(row_id, 0, row, format_integer)
+
+TEAM_DAMAGE_ROLES = ["Mage", "Marksman", "Warrior"]
+TEAM_HEALER_ROLE = "Healer"
+# Roles that can answer defense orbs, except Jhu who can't one-shot them; Orion can despite being a Mage
+DEFENSE_ORB_ROLES = ["Warrior", "Marksman"]
+DEFENSE_ORB_EXCLUDED_HEROES = ["Jhu"]
+DEFENSE_ORB_HEROES = ["Orion"]
+# Heroes worth putting in a roster team: strong ones, and supports and healers whatever their power
+TEAM_CANDIDATE_POWER = 50000
+TEAM_CANDIDATE_ROLES = ["Support", "Healer"]
+TEAM_CHECKS = ["Penetration", "Healer", "Meteors", "Defense Orbs"]
+# Boss stats each check needs; a check whose stats are missing from the boss file is skipped
+TEAM_CHECK_BOSS_STATS = {
+    "Penetration": ["armor"],
+    "Meteors": ["meteorShowerMaxDamage"],
+}
+# Share of the boss's armor (or magic defense) a damage dealer needs as armor (or magic)
+# penetration, unless the boss file sets penetrationShare. In the December 2021 dumps the
+# weakest physical dealer of the best quarter of teams at 125 and 130 has about 1800-2100
+# armor penetration, around 5% of the boss's 35000 armor.
+DEFAULT_PENETRATION_SHARE = 0.05
+ROSTER_TEAMS_PER_PLAYER = 20
+
+def hero_role_table(hero_data):
+    """
+    The role of every hero id, "" for heroes without one.
+    """
+    roles = [""] * len(hero_data["heroes"])
+    for role in hero_data["roles"]:
+        for role_name, hero_names in role.items():
+            for hero_name in hero_names:
+                if hero_name not in hero_data["heroes"]:
+                    raise Exception(f"Unknown hero in {role_name} role: {hero_name}")
+                roles[hero_data["heroes"].index(hero_name)] = role_name
+    return numpy.array(roles)
+
+def check_teams(team_ids, team_hp, team_armor_penetration, team_magic_penetration, hero_roles, hero_data, boss_data):
+    """
+    Run the team checklist over a batch of teams at once. Each argument is an
+    [n, 5] array with one stat of every hero of every team, id 0 marking an
+    empty slot. Returns an [n] pass/fail array for each of TEAM_CHECKS whose
+    boss stats are set in boss_data:
+    1. Penetration: every damage dealer has enough armor penetration for the
+       boss's armor, or magic penetration for its magic defense. Heroes with
+       neither deal pure damage and always pass, and so do magic dealers when
+       the boss's magic defense isn't set.
+    2. Healer: the team has a healer.
+    3. Meteors: every hero has more HP than the biggest meteor shower hit.
+    4. Defense Orbs: the team has a Warrior, a Marksman that isn't Jhu, or Orion.
+    """
+    # Per hero id lookups, so the teams only need to be indexed into
+    is_dealer = numpy.isin(hero_roles, TEAM_DAMAGE_ROLES)
+    is_healer = hero_roles == TEAM_HEALER_ROLE
+    answers_orbs = numpy.isin(hero_roles, DEFENSE_ORB_ROLES)
+    answers_orbs[[hero_data["heroes"].index(name) for name in DEFENSE_ORB_EXCLUDED_HEROES]] = False
+    answers_orbs[[hero_data["heroes"].index(name) for name in DEFENSE_ORB_HEROES]] = True
+    is_dealer[0] = is_healer[0] = answers_orbs[0] = False
+
+    checks = {
+        "Healer": is_healer[team_ids].any(axis=1),
+        "Defense Orbs": answers_orbs[team_ids].any(axis=1),
+    }
+    if team_check_configured("Penetration", boss_data):
+        physical = team_armor_penetration > 0
+        magical = ~physical & (team_magic_penetration > 0)
+        share = boss_data.get("penetrationShare", DEFAULT_PENETRATION_SHARE)
+        penetrates = ~physical | (team_armor_penetration >= share * boss_data["armor"])
+        if boss_data.get("magicDefense") is not None:
+            penetrates &= ~magical | (team_magic_penetration >= share * boss_data["magicDefense"])
+        checks["Penetration"] = (penetrates | ~is_dealer[team_ids]).all(axis=1)
+    if team_check_configured("Meteors", boss_data):
+        checks["Meteors"] = ((team_hp > boss_data["meteorShowerMaxDamage"]) | (team_ids == 0)).all(axis=1)
+    return checks
+
+def team_check_configured(check, boss_data):
+    return all(boss_data.get(stat) is not None for stat in TEAM_CHECK_BOSS_STATS.get(check, []))
+
+def team_check_columns(checks, passes, rows):
+    """
+    The check columns of a page for the given rows, then All Checks. Checks
+    that aren't configured read "not configured".
+    """
+    return [checks[check][rows].tolist() if check in checks else ["not configured"] * len(rows) for check in TEAM_CHECKS] + [passes[rows].tolist()]
+
+def effective_hp(match_table, rows, slots):
+    return match_table["hero_hp"][rows, slots] + 40 * match_table["hero_strength"][rows, slots]
+
+@profiled
+def add_team_summary_page(workbook, match_table, guild_roster, hero_data, buff_data, boss_data):
+    """
+    Output: Player|Difficulty|Damage|Hero 1..5|Team Power|Penetration|Healer|Meteors|Defense Orbs|All Checks
+    One row per boss match of the week, strongest first.
+    """
+    num_matches = len(match_table["match_id"])
+    rows = numpy.arange(num_matches)[:, None]
+    slots = numpy.arange(MAX_TEAM_HEROES)[None, :]
+    team_ids = match_table["hero_ids"][:, :MAX_TEAM_HEROES]
+    checks = check_teams(
+        team_ids,
+        effective_hp(match_table, rows, slots),
+        match_table["hero_armor_penetration"][:, :MAX_TEAM_HEROES],
+        match_table["hero_magic_penetration"][:, :MAX_TEAM_HEROES],
+        hero_role_table(hero_data), hero_data, boss_data)
+    if "Meteors" in checks:
+        shield_idxs = [buff_idx for buff_idx, buff_id in enumerate(match_table["buff_names"].tolist())
+                       if (lookup_buff(buff_data, buff_id) or (None,))[0] in boss_data.get("meteorShieldBuffs", [])]
+        checks["Meteors"] |= numpy.isin(match_table["buff_slots"], shield_idxs).any(axis=1)
+    passes = numpy.logical_and.reduce(list(checks.values()))
+    damages = match_total_damages(match_table).tolist()
+    team_powers = match_table["hero_powers"][:, :MAX_TEAM_HEROES].sum(axis=1).tolist()
+
+    worksheet = workbook.add_worksheet("Team Summary")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Player", "Difficulty", "Damage"] + [f"Hero {slot + 1}" for slot in range(MAX_TEAM_HEROES)] + ["Team Power"] + TEAM_CHECKS + ["All Checks"])
+    check_columns = team_check_columns(checks, passes, numpy.arange(num_matches))
+    team_ids = team_ids.tolist()
+    for row_id, row in enumerate(numpy.argsort(-numpy.array(damages), kind="stable").tolist(), start=1):
+        worksheet.write_row(row_id, 0, [guild_roster.name(str(match_table["player_id"][row])), int(match_table["level"][row])])
+        worksheet.write_row(row_id, 2, [damages[row]], format_integer)
+        worksheet.write_row(row_id, 3, [lookup_hero(hero_data, hero_id) if hero_id else None for hero_id in team_ids[row]])
+        worksheet.write_row(row_id, 3 + MAX_TEAM_HEROES, [team_powers[row]], format_integer)
+        worksheet.write_row(row_id, 4 + MAX_TEAM_HEROES, [column[row] for column in check_columns])
+
+def player_rosters(match_table, team_slots=slice(0, MAX_TEAM_HEROES)):
+    """
+    The (row, slot) in the match table of every hero of every player, from the
+    latest match the player fielded it in, grouped by player. Pass the pet
+    slot as team_slots for every pet instead.
+    """
+    hero_ids = match_table["hero_ids"][:, team_slots]
+    rows, slots = numpy.nonzero(hero_ids)
+    slots += team_slots.start
+    hero_ids = match_table["hero_ids"]
+    player_ids = match_table["player_id"][rows]
+    heroes = hero_ids[rows, slots]
+    order = numpy.lexsort((match_table["start_time"][rows], heroes, player_ids))
+    rows, slots, player_ids, heroes = rows[order], slots[order], player_ids[order], heroes[order]
+    latest = numpy.ones(len(rows), dtype=bool)
+    latest[:-1] = (player_ids[1:] != player_ids[:-1]) | (heroes[1:] != heroes[:-1])
+    return rows[latest], slots[latest]
+
+@functools.lru_cache(maxsize=None)
+def team_combinations(num_heroes):
+    """
+    Every 5 hero combination of range(num_heroes) as an [n, 5] array, shared
+    by all the players with that many candidate heroes.
+    """
+    return numpy.fromiter(itertools.chain.from_iterable(itertools.combinations(range(num_heroes), MAX_TEAM_HEROES)), dtype=numpy.int64).reshape(-1, MAX_TEAM_HEROES)
+
+@profiled
+def add_roster_teams_page(workbook, match_table, guild_roster, hero_data, boss_data):
+    """
+    Output: Player|Teams Checked|Teams Passing|Hero 1..5|Team Power|Penetration|Healer|Meteors|Defense Orbs|All Checks
+    Every 5 hero combination of each player's candidate heroes (those seen in
+    the week's matches, at their latest stats) goes through the team
+    checklist as one batch per player. The best teams of each player are
+    written: most checks passed, then most power.
+    """
+    hero_roles = hero_role_table(hero_data)
+    roster_rows, roster_slots = player_rosters(match_table)
+    roster_ids = match_table["hero_ids"][roster_rows, roster_slots]
+    roster_powers = match_table["hero_powers"][roster_rows, roster_slots]
+    roster_hp = effective_hp(match_table, roster_rows, roster_slots)
+    roster_armor_penetration = match_table["hero_armor_penetration"][roster_rows, roster_slots]
+    roster_magic_penetration = match_table["hero_magic_penetration"][roster_rows, roster_slots]
+    candidates = (roster_powers > TEAM_CANDIDATE_POWER) | numpy.isin(hero_roles[roster_ids], TEAM_CANDIDATE_ROLES)
+    roster_player_ids = match_table["player_id"][roster_rows]
+    player_starts = numpy.flatnonzero(numpy.r_[True, roster_player_ids[1:] != roster_player_ids[:-1]])
+
+    worksheet = workbook.add_worksheet("Roster Teams")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Player", "Teams Checked", "Teams Passing"] + [f"Hero {slot + 1}" for slot in range(MAX_TEAM_HEROES)] + ["Team Power"] + TEAM_CHECKS + ["All Checks"])
+    row_id = 1
+    for start, end in zip(player_starts.tolist(), numpy.r_[player_starts[1:], len(roster_ids)].tolist()):
+        heroes = start + numpy.flatnonzero(candidates[start:end])
+        if len(heroes) < MAX_TEAM_HEROES:
+            heroes = numpy.arange(start, end)
+        if len(heroes) < MAX_TEAM_HEROES:
+            continue
+        teams = heroes[team_combinations(len(heroes))]
+        checks = check_teams(roster_ids[teams], roster_hp[teams], roster_armor_penetration[teams], roster_magic_penetration[teams], hero_roles, hero_data, boss_data)
+        passes = numpy.logical_and.reduce(list(checks.values()))
+        num_passed = numpy.sum(list(checks.values()), axis=0)
+        team_powers = roster_powers[teams].sum(axis=1)
+        best = numpy.lexsort((-team_powers, -num_passed))[:ROSTER_TEAMS_PER_PLAYER]
+        player_name = guild_roster.name(str(roster_player_ids[start]))
+        check_columns = team_check_columns(checks, passes, best)
+        for best_idx, team in enumerate(best.tolist()):
+            worksheet.write_row(row_id, 0, [player_name, len(teams), int(passes.sum())])
+            worksheet.write_row(row_id, 3, [lookup_hero(hero_data, hero_id) for hero_id in roster_ids[teams[team]].tolist()])
+            worksheet.write_row(row_id, 3 + MAX_TEAM_HEROES, [int(team_powers[team])], format_integer)
+            worksheet.write_row(row_id, 4 + MAX_TEAM_HEROES, [column[best_idx] for column in check_columns])
+            row_id += 1
+
+# Matches a hero pair needs to share before its synergy counts for half of what was observed
+TEAM_SYNERGY_PRIOR_MATCHES = 20
+
+@profiled
+def fit_team_synergy(history, hero_attribution, prior_matches=TEAM_SYNERGY_PRIOR_MATCHES):
+    """
+    How much more boss damage each pair of heroes does together than the
+    attribution fit predicts from their powers alone: the mean residual of the
+    matches they shared, spread over the 10 pairs of a team and shrunk toward 0
+    for pairs seen in few matches.
+    Output: [num_heroes, num_heroes] symmetric, with a zero diagonal
+    """
+    num_heroes = hero_attribution["num_heroes"]
+    num_pets = hero_attribution["num_pets"]
+    coefficients = hero_attribution["coefficients"]
+    hero_ids = history_column(history, "hero_ids").astype(numpy.int64)
+    powers = history_column(history, "hero_powers") / ATTRIBUTION_POWER_UNIT
+    damages = match_total_damages(history).astype(float)
+    level_idxs = numpy.searchsorted(hero_attribution["levels"], history["level"])
+
+    heroes = hero_ids[:, :MAX_TEAM_HEROES]
+    known = (heroes > 0) & (heroes < num_heroes)
+    heroes = numpy.where(known, heroes, 0)
+    predicted = numpy.where(known, coefficients[heroes] * powers[:, :MAX_TEAM_HEROES], 0.0).sum(axis=1)
+    pet_idxs = hero_ids[:, PET_SLOT] - PET_ID_START
+    known_pet = (pet_idxs >= 0) & (pet_idxs < num_pets)
+    predicted += numpy.where(known_pet, coefficients[num_heroes + numpy.where(known_pet, pet_idxs, 0)] * powers[:, PET_SLOT], 0.0)
+    predicted += coefficients[num_heroes + num_pets + level_idxs]
+    residuals = damages - predicted
+
+    pair_idxs = []
+    pair_residuals = []
+    for first, second in itertools.combinations(range(MAX_TEAM_HEROES), 2):
+        both = known[:, first] & known[:, second]
+        pair_idxs += [heroes[both, first] * num_heroes + heroes[both, second], heroes[both, second] * num_heroes + heroes[both, first]]
+        pair_residuals += [residuals[both]] * 2
+    pair_idxs = numpy.concatenate(pair_idxs)
+    pair_residuals = numpy.concatenate(pair_residuals)
+    sums = numpy.bincount(pair_idxs, weights=pair_residuals, minlength=num_heroes * num_heroes)
+    counts = numpy.bincount(pair_idxs, minlength=num_heroes * num_heroes)
+    num_pairs = MAX_TEAM_HEROES * (MAX_TEAM_HEROES - 1) // 2
+    synergy = (sums / (counts + prior_matches) / num_pairs).reshape(num_heroes, num_heroes)
+    numpy.fill_diagonal(synergy, 0.0)
+    return synergy
+
+def search_best_team(values, synergy):
+    """
+    Branch and bound search for the 5 of n heroes with the highest sum of
+    values plus pairwise synergy, without scoring all C(n, 5) teams. Heroes are
+    tried best value first, starting from the greedy team's score. A branch is
+    cut when its optimistic bound can't beat the best team so far: each hero
+    still to join adds its value, its positive synergy with the heroes already
+    in, and half its best positive synergies with the others still to join
+    (the other half is theirs). The score of every partial team is memoized and
+    built from its parent's.
+    Returns (hero indexes, score, number of full teams scored)
+    """
+    num_heroes = len(values)
+    order = numpy.argsort(-values, kind="stable")
+    values = values[order]
+    synergy = synergy[numpy.ix_(order, order)]
+    positive = numpy.maximum(synergy, 0.0)
+    # best_positive[hero, k]: sum of the hero's k largest positive synergies
+    best_positive = numpy.zeros((num_heroes, MAX_TEAM_HEROES))
+    best_positive[:, 1:] = numpy.cumsum(-numpy.sort(-positive, axis=1), axis=1)[:, :MAX_TEAM_HEROES - 1]
+
+    partial_scores = { (): 0.0 }
+    def partial_score(team):
+        score = partial_scores.get(team)
+        if score is None:
+            parent = team[:-1]
+            score = partial_score(parent) + values[team[-1]] + synergy[team[-1], list(parent)].sum()
+            partial_scores[team] = score
+        return score
+
+    greedy = tuple(range(MAX_TEAM_HEROES))
+    best = [greedy, partial_score(greedy)]
+    num_scored = [1]
+    def search(team, start):
+        remaining = MAX_TEAM_HEROES - len(team)
+        if remaining == 0:
+            num_scored[0] += 1
+            if partial_score(team) > best[1]:
+                best[:] = [team, partial_score(team)]
+            return
+        optimistic = values[start:] + positive[start:, list(team)].sum(axis=1) + 0.5 * best_positive[start:, remaining - 1]
+        if partial_score(team) + numpy.partition(optimistic, len(optimistic) - remaining)[-remaining:].sum() <= best[1]:
+            return
+        for hero in range(start, num_heroes - remaining + 1):
+            search(team + (hero,), hero + 1)
+    search((), 0)
+    return order[list(best[0])], best[1], num_scored[0]
+
+# The search takes about 0.12 ms per candidate hero and starting a process pool
+# about 100 ms, so smaller guilds are searched serially
+RECOMMEND_PARALLEL_MIN_CANDIDATES = 2000
+
+def recommend_player_team(candidates):
+    values, synergy = candidates
+    return search_best_team(values, synergy)
+
+@profiled
+def add_team_recommendation_page(workbook, match_table, guild_roster, hero_data, hero_attribution, team_synergy, workers=1):
+    """
+    Output: Player|Difficulty|Hero 1..5|Pet|Predicted Damage|Candidates|Teams Scored|Possible Teams
+    The best 5 heroes and pet of each player for the highest difficulty they
+    fought this week. A hero is worth its attribution coefficient times its
+    latest power, plus its pairwise synergy with the rest of the team; see
+    search_best_team. Players are searched in parallel on workers processes
+    once there are RECOMMEND_PARALLEL_MIN_CANDIDATES candidates in all.
+    """
+    num_heroes = hero_attribution["num_heroes"]
+    num_pets = hero_attribution["num_pets"]
+    coefficients = hero_attribution["coefficients"]
+    levels = hero_attribution["levels"].tolist()
+    hero_rows, hero_slots = player_rosters(match_table)
+    pet_rows, pet_slots = player_rosters(match_table, slice(PET_SLOT, PET_SLOT + 1))
+    def attacker_values(rows, slots, columns):
+        known = (columns >= 0) & (columns < len(coefficients))
+        return numpy.where(known, coefficients[numpy.where(known, columns, 0)], 0.0) * match_table["hero_powers"][rows, slots] / ATTRIBUTION_POWER_UNIT
+    hero_ids = match_table["hero_ids"][hero_rows, hero_slots]
+    # Heroes missing from the heroes file have no attribution or synergy to score them by
+    known = hero_ids < num_heroes
+    if not known.all():
+        print(f"Team recommendations: leaving out heroes missing from the heroes file: {', '.join(map(str, numpy.unique(hero_ids[~known]).tolist()))}")
+        hero_rows, hero_slots, hero_ids = hero_rows[known], hero_slots[known], hero_ids[known]
+    hero_values = attacker_values(hero_rows, hero_slots, hero_ids)
+    pet_idxs = match_table["hero_ids"][pet_rows, pet_slots] - PET_ID_START
+    pet_values = attacker_values(pet_rows, pet_slots, numpy.where((pet_idxs >= 0) & (pet_idxs < num_pets), num_heroes + pet_idxs, -1))
+    hero_players = match_table["player_id"][hero_rows]
+    pet_players = match_table["player_id"][pet_rows]
+
+    player_ids = []
+    candidates = []
+    for player_id in numpy.unique(hero_players).tolist():
+        players_heroes = numpy.flatnonzero(hero_players == player_id)
+        if len(players_heroes) < MAX_TEAM_HEROES:
+            continue
+        player_ids.append(player_id)
+        ids = hero_ids[players_heroes]
+        candidates.append((hero_values[players_heroes], team_synergy[numpy.ix_(ids, ids)]))
+    if workers > 1 and len(candidates) > 1 and sum(len(values) for values, _ in candidates) >= RECOMMEND_PARALLEL_MIN_CANDIDATES:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(recommend_player_team, candidates, chunksize=math.ceil(len(candidates) / workers)))
+    else:
+        results = list(map(recommend_player_team, candidates))
+
+    rows = []
+    for player_id, (values, _), (team, score, num_scored) in zip(player_ids, candidates, results):
+        players_heroes = numpy.flatnonzero(hero_players == player_id)
+        players_pets = numpy.flatnonzero(pet_players == player_id)
+        pet = None
+        if len(players_pets) > 0:
+            best_pet = players_pets[numpy.argmax(pet_values[players_pets])]
+            pet = (int(match_table["hero_ids"][pet_rows[best_pet], PET_SLOT]), pet_values[best_pet])
+            score += pet[1]
+        difficulty = int(match_table["level"][match_table["player_id"] == player_id].max())
+        predicted = score + coefficients[num_heroes + num_pets + levels.index(difficulty)] if difficulty in levels else None
+        rows.append([
+            guild_roster.name(str(player_id)),
+            difficulty] +
+            [lookup_hero(hero_data, hero_id) for hero_id in hero_ids[players_heroes[team]].tolist()] + [
+            lookup_pet(hero_data, pet[0]) if pet is not None else None,
+            predicted,
+            len(values),
+            num_scored,
+            math.comb(len(values), MAX_TEAM_HEROES)
+        ])
+    rows.sort(key=lambda row: -math.inf if row[8] is None else row[8], reverse=True)
+
+    worksheet = workbook.add_worksheet("Team Recommendations")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Player", "Difficulty"] + [f"Hero {slot + 1}" for slot in range(MAX_TEAM_HEROES)] + ["Pet", "Predicted Damage", "Candidates", "Teams Scored", "Possible Teams"])
+    for row_id, row in enumerate(rows, start=1):
+        worksheet.write_row(row_id, 0, row[:8])
+        worksheet.write_row(row_id, 8, row[8:], format_integer)
+
+@profiled
+def add_history_summary_page(workbook, history_rollup, guild_roster):
+    max_damages = {}
+    difficulties = set()
+    for player_id, player_difficulty_stats in history_rollup["players"].items():
+        for difficulty, stats in player_difficulty_stats.items():
+            difficulties.add(int(difficulty))
+            max_damages.setdefault(player_id, {})[int(difficulty)] = stats["max"]
+    # Write summary
+    worksheet = workbook.add_worksheet("Player Historical Summary")
+    worksheet.write_row(0, 0, ["Player"] + [f"Max total damage to {difficulty} boss" for difficulty in sorted(difficulties)])
+    sorted_stats = sorted(max_damages.items(), key=lambda x: x[1].get(sorted(difficulties)[-2], 0.0), reverse=True)
+    for row, (player_id, player_difficulty_damages) in enumerate(sorted_stats, 1):
+        worksheet.write_row(row, 0, [guild_roster.name(player_id)] + [player_difficulty_damages.get(difficulty) for difficulty in sorted(difficulties)])
+
+TREND_WINDOW_WEEKS = 4
+TREND_EMA_SPAN_WEEKS = 4
+TREND_DECLINE_FRACTION = 0.1
+
+def history_trends(damages, window=TREND_WINDOW_WEEKS, ema_span=TREND_EMA_SPAN_WEEKS, decline_fraction=TREND_DECLINE_FRACTION):
+    """
+    Trend statistics of a [players, weeks, difficulties] damage array, with
+    NaN for the weeks a player didn't fight, computed for every week at once.
+    Output, each [players, weeks, difficulties]:
+    {
+        rolling_average:    # Mean of the weeks played out of the last `window`
+        week_over_week:     # Change from the week before, when both were played
+        ema:                # Exponential moving average of the weeks played, held through the others
+        declining:          # Rolling average down by decline_fraction or more from `window` weeks earlier
+    }
+    """
+    num_weeks = damages.shape[1]
+    played = ~numpy.isnan(damages)
+    # Window sums from cumulative sums along the weeks
+    cumulative_damages = numpy.concatenate([numpy.zeros_like(damages[:, :1]), numpy.cumsum(numpy.where(played, damages, 0.0), axis=1)], axis=1)
+    cumulative_played = numpy.concatenate([numpy.zeros_like(played[:, :1], dtype=numpy.int64), numpy.cumsum(played, axis=1)], axis=1)
+    window_starts = numpy.maximum(numpy.arange(num_weeks) + 1 - window, 0)
+    window_damages = cumulative_damages[:, 1:] - cumulative_damages[:, window_starts]
+    window_played = cumulative_played[:, 1:] - cumulative_played[:, window_starts]
+    rolling_average = numpy.divide(window_damages, window_played, out=numpy.full_like(window_damages, numpy.nan), where=window_played > 0)
+
+    week_over_week = numpy.full_like(damages, numpy.nan)
+    week_over_week[:, 1:] = damages[:, 1:] - damages[:, :-1]
+
+    # The recurrence runs along the weeks, but each step covers every player and difficulty
+    alpha = 2 / (ema_span + 1)
+    ema = numpy.full_like(damages, numpy.nan)
+    current = numpy.full_like(damages[:, 0], numpy.nan)
+    for week_idx in range(num_weeks):
+        week_damages = damages[:, week_idx]
+        current = numpy.where(numpy.isnan(week_damages), current, numpy.where(numpy.isnan(current), week_damages, alpha * week_damages + (1 - alpha) * current))
+        ema[:, week_idx] = current
+
+    earlier_average = numpy.full_like(rolling_average, numpy.nan)
+    earlier_average[:, window:] = rolling_average[:, :-window]
+    with numpy.errstate(invalid="ignore"):
+        declining = rolling_average < (1 - decline_fraction) * earlier_average
+    return {
+        "rolling_average": rolling_average,
+        "week_over_week": week_over_week,
+        "ema": ema,
+        "declining": declining,
+    }
+
+@profiled
+def add_player_trends_page(workbook, week_damages, guild_roster):
+    """
+    Output: Player|Difficulty|Weeks Played|Last Week|4-Week Average|Week over Week|EMA|Declining
+    Each player's trend as of the latest week, over all difficulties together
+    and at each difficulty they fought in the last 4 weeks.
+    """
+    worksheet = workbook.add_worksheet("Player Trends")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Player", "Difficulty", "Weeks Played", "Last Week", f"{TREND_WINDOW_WEEKS}-Week Average", "Week over Week", "EMA", "Declining"])
+    damages = week_damages["damages"]
+    if damages.shape[1] == 0:
+        return
+    played = ~numpy.isnan(damages)
+    totals = numpy.where(played.any(axis=2), numpy.nansum(damages, axis=2), numpy.nan)
+    damages = numpy.concatenate([totals[:, :, None], damages], axis=2)
+    played = ~numpy.isnan(damages)
+    trends = history_trends(damages)
+    difficulties = ["All"] + week_damages["difficulties"].tolist()
+    weeks_played = played.sum(axis=1)
+    recently_played = played[:, -TREND_WINDOW_WEEKS:].any(axis=1)
+    last = { name: values[:, -1] for name, values in trends.items() }
+    last["damage"] = damages[:, -1]
+
+    def cell(value):
+        return None if math.isnan(value) else value
+
+    row_id = 1
+    order = numpy.argsort(-numpy.nan_to_num(totals[:, -1], nan=-numpy.inf), kind="stable")
+    for player_idx in order.tolist():
+        name = guild_roster.name(str(week_damages["player_ids"][player_idx]))
+        for difficulty_idx in numpy.flatnonzero(recently_played[player_idx]).tolist():
+            worksheet.write_row(row_id, 0, [name, difficulties[difficulty_idx], int(weeks_played[player_idx, difficulty_idx])])
+            worksheet.write_row(row_id, 3, [cell(last[column][player_idx, difficulty_idx]) for column in ["damage", "rolling_average", "week_over_week", "ema"]], format_integer)
+            worksheet.write(row_id, 7, bool(last["declining"][player_idx, difficulty_idx]))
+            row_id += 1
+
+def top_k_by_group(values, groups, k):
+    """
+    Indexes of the k largest values in each group, best first, as
+    { group: [k] }. Grouping is a stable sort of the small integer group ids,
+    which numpy does as a linear radix sort, and each group's top k is picked
+    with argpartition, so only the winners are ever sorted by value.
+    """
+    order = numpy.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    bounds = numpy.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1
+    starts = numpy.concatenate([[0], bounds]).tolist()
+    ends = numpy.concatenate([bounds, [len(order)]]).tolist()
+    ret = {}
+    for start, end in zip(starts, ends):
+        if start == end:
+            continue
+        idxs = order[start:end]
+        if len(idxs) > k:
+            idxs = idxs[numpy.argpartition(-values[idxs], k - 1)[:k]]
+        ret[sorted_groups[start].item()] = idxs[numpy.argsort(-values[idxs], kind="stable")]
+    return ret
+
+def history_leaderboard(history, group_by, k, damages=None):
+    """
+    The k highest damage matches of each group in the compact history, best
+    first, as { group: [k] match rows }. Groups are boss difficulties,
+    players by their index in player_ids, or heroes, where a match counts for
+    every hero in its team. damages can be passed in so several leaderboards
+    share one damage column.
+    """
+    if damages is None:
+        damages = match_total_damages(history)
+    if group_by == "difficulty":
+        rows = numpy.arange(len(damages))
+        groups = history["level"]
+    elif group_by == "player":
+        rows = numpy.arange(len(damages))
+        groups = history["player_idx"]
+    elif group_by == "hero":
+        hero_ids = history_column(history, "hero_ids")[:, :MAX_TEAM_HEROES]
+        rows, slots = numpy.nonzero(hero_ids)
+        groups = hero_ids[rows, slots]
+    else:
+        raise Exception("Unknown leaderboard grouping " + group_by)
+    return { group: rows[idxs] for group, idxs in top_k_by_group(damages[rows], groups, k).items() }
+
+# (title, grouping, matches per group)
+LEADERBOARDS = [
+    ("Top matches per difficulty", "difficulty", 20),
+    ("Top matches per player", "player", 3),
+    ("Best team per hero", "hero", 1),
+]
+
+@profiled
+def add_leaderboard_page(workbook, history, guild_roster, hero_data):
+    """
+    Output: Leaderboard|Group|Rank|Player|Week|Difficulty|Total Damage to Boss|Team|Replay Link
+    The best matches of the whole history for each of LEADERBOARDS. Groups
+    are ordered by their best match, except difficulties, hardest first.
+    """
+    worksheet = workbook.add_worksheet("Leaderboards")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Leaderboard", "Group", "Rank", "Player", "Week", "Difficulty", "Total Damage to Boss", "Team", "Replay Link"])
+    damages = match_total_damages(history)
+
+    def group_name(group_by, group):
+        if group_by == "player":
+            return guild_roster.name(str(history["player_ids"][group]))
+        if group_by == "hero":
+            return lookup_hero(hero_data, group)
+        return group
+
+    def team_names(row):
+        hero_ids = history["hero_ids"][history["snapshots"][row]].tolist()
+        names = [lookup_hero(hero_data, hero_id) for hero_id in hero_ids[:MAX_TEAM_HEROES] if hero_id != 0]
+        if hero_ids[PET_SLOT] != 0:
+            names.append(lookup_pet(hero_data, hero_ids[PET_SLOT]))
+        return ", ".join(str(name) for name in names)
+
+    row_id = 1
+    for title, group_by, k in LEADERBOARDS:
+        leaderboard = history_leaderboard(history, group_by, k, damages)
+        if group_by == "difficulty":
+            groups = sorted(leaderboard, reverse=True)
+        else:
+            groups = sorted(leaderboard, key=lambda group: damages[leaderboard[group][0]], reverse=True)
+        for group in groups:
+            for rank, row in enumerate(leaderboard[group].tolist(), start=1):
+                worksheet.write_row(row_id, 0, [title, group_name(group_by, group), rank, guild_roster.name(str(history["player_ids"][history["player_idx"][row]])), str(history["weeks"][history["week_idx"][row]]), int(history["level"][row])])
+                worksheet.write(row_id, 6, int(damages[row]), format_integer)
+                worksheet.write_row(row_id, 7, [team_names(row), "https://hero-wars.com?replay_id=" + str(history["match_id"][row])])
+                row_id += 1
+
+@profiled
+def read_asgard_data_json(filename):
+    f = open(filename)
+    asgard_data = json.load(f)
+    timestamp = asgard_data["date"] # 1638051586
+    if len(asgard_data["results"]) == 4:
+        _, summary_data, minion_matches, boss_matches = asgard_data["results"]
+    elif len(asgard_data["results"]) == 3:
+        summary_data, minion_matches, boss_matches = asgard_data["results"]
+    else:
+        raise Exception("Unknown number of results in JSON")
+    return timestamp, summary_data, minion_matches, boss_matches
+
+STREAM_CHUNK_SIZE = 1 << 16
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class JsonStream:
+    """
+    Incremental reader over a JSON text file. Objects and arrays are walked one
+    key or element at a time, and only the values that are asked for get
+    decoded, so memory is bounded by the largest single value rather than by
+    the file.
+    """
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.buf_offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size):
+        chunk = self.f.read(size)
+        self.buf_offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        if len(chunk) < size:
+            self.eof = True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or "" at end of file."""
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self._fill(self.chunk_size)
+
+    def tell(self):
+        """Offset in the file of the next unread character."""
+        return self.buf_offset + self.pos
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise Exception(f"Expected '{char}' in JSON stream but found '{found}'")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number that runs into the end of the buffer may be truncated.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(max(self.chunk_size, len(self.buf)))
+
+    def skip(self, depth=2):
+        """Consume the next value, walking the outer containers so large sections are never decoded whole."""
+        char = self.peek()
+        if depth > 0 and char == "{":
+            for _ in self.items():
+                self.skip(depth - 1)
+        elif depth > 0 and char == "[":
+            for _ in self.elements():
+                self.skip(depth - 1)
+        else:
+            self.value()
+
+    def _separator(self, close):
+        char = self.peek()
+        self.pos += 1
+        if char == close:
+            return False
+        if char != ",":
+            raise Exception(f"Expected ',' or '{close}' in JSON stream but found '{char}'")
+        return True
+
+    def items(self):
+        """Yield the keys of an object. Each value must be consumed before advancing."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        more = True
+        while more:
+            key = self.value()
+            self.expect(":")
+            yield key
+            more = self._separator("}")
+
+    def elements(self):
+        """Yield the indexes of an array. Each element must be consumed before advancing."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        more = True
+        idx = 0
+        while more:
+            yield idx
+            idx += 1
+            more = self._separator("]")
+
+def walk_boss_matches(stream):
+    """
+    Walk an Asgard dump to its boss matches, yielding (player_id, match_id)
+    with the stream positioned at each match. The match must be consumed
+    before advancing.
+    {
+        date:,
+        results: [
+            [{ result: { response: [true] } },] # Only present in some dumps
+            { result: { response: $SUMMARY } },
+            { result: { response: $MINION_MATCHES } },
+            { result: { response: { $PLAYER_ID: { $MATCH_ID: $MATCH } } } }
+        ]
+    }
+    """
+    for key in stream.items():
+        if key != "results":
+            stream.skip()
+            continue
+        boss_section = 2
+        num_sections = 0
+        for section in stream.elements():
+            num_sections += 1
+            for section_key in stream.items():
+                if section_key != "result":
+                    stream.skip()
+                    continue
+                for result_key in stream.items():
+                    if result_key != "response":
+                        stream.skip()
+                    elif section == 0 and stream.peek() == "[":
+                        boss_section = 3
+                        stream.skip()
+                    elif section == boss_section:
+                        for player_id in stream.items():
+                            for match_id in stream.items():
+                                yield player_id, match_id
+                    else:
+                        stream.skip()
+        if num_sections != boss_section + 1:
+            raise Exception("Unknown number of results in JSON")
+
+def iter_asgard_matches(filename):
+    """
+    Streaming counterpart of read_asgard_data_json for the boss matches:
+    yields one (player_id, match_id, match) record at a time without ever
+    holding the whole dump in memory.
+    """
+    with open(filename) as f:
+        stream = JsonStream(f)
+        for player_id, match_id in walk_boss_matches(stream):
+            yield player_id, match_id, stream.value()
+
+CACHE_VERSION = 2
+
+def file_fingerprint(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def week_cache_file(cache_dir, filename, suffix=".npz"):
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{os.path.basename(filename)}-{path_hash}{suffix}")
+
+@contextlib.contextmanager
+def replace_atomically(filename, mode="wb"):
+    """
+    Write to a temporary file of this writer's own next to filename, and only
+    move it over filename once it is complete. Concurrent writers of the same
+    file then never share or delete each other's temporary file.
+    """
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix=os.path.basename(filename) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_file, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+        raise
+
+def save_source_cache(cache_file, arrays, stat, fingerprint, cache_version):
+    with replace_atomically(cache_file) as f:
+        numpy.savez(f,
+            cache_version=cache_version,
+            source_mtime_ns=stat.st_mtime_ns,
+            source_size=stat.st_size,
+            source_sha1=fingerprint,
+            **arrays)
+
+def load_source_cache(filename, cache_file, cache_version, build):
+    """
+    The arrays build(filename) computes from a source file, read from an
+    on-disk cache when possible. A cache is trusted while the source's mtime
+    and size are unchanged; otherwise its content hash decides whether the
+    arrays have to be built again.
+    """
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    stat = os.stat(filename)
+    fingerprint = None
+    if os.path.exists(cache_file):
+        with numpy.load(cache_file) as cached:
+            cached = dict(cached)
+        if int(cached.pop("cache_version")) == cache_version:
+            source_mtime_ns = int(cached.pop("source_mtime_ns"))
+            source_size = int(cached.pop("source_size"))
+            source_sha1 = str(cached.pop("source_sha1"))
+            if source_mtime_ns == stat.st_mtime_ns and source_size == stat.st_size:
+                return cached
+            fingerprint = file_fingerprint(filename)
+            if fingerprint == source_sha1:
+                save_source_cache(cache_file, cached, stat, fingerprint, cache_version)
+                return cached
+    arrays = build(filename)
+    save_source_cache(cache_file, arrays, stat, fingerprint or file_fingerprint(filename), cache_version)
+    return arrays
+
+def parse_week_table(filename):
+    print(f"Parsing {filename}", file=sys.stderr)
+    return extract_match_table(iter_asgard_matches(filename))
+
+@profiled
+def load_week_table(filename, cache_dir):
+    """
+    The match table for one Asgard dump, read from the on-disk cache when
+    possible.
+    """
+    return load_source_cache(filename, week_cache_file(cache_dir, filename), CACHE_VERSION, parse_week_table)
+
+MATCH_INDEX_VERSION = 1
+
+@profiled
+def build_match_index(filename):
+    """
+    Where each boss match sits in an Asgard dump, as byte offsets, so a single
+    match can be decoded without reading the rest of the dump. The dump is
+    read as latin-1 so that stream offsets are byte offsets: JSON syntax is
+    all ASCII, and the UTF-8 text in between is never looked at.
+    Output:
+    {
+        match_id: [n], player_id: [n], start_time: [n], start: [n], end: [n]
+    }
+    """
+    print(f"Indexing {filename}", file=sys.stderr)
+    columns = { column: [] for column in ["match_id", "player_id", "start_time", "start", "end"] }
+    with open(filename, encoding="latin-1") as f:
+        stream = JsonStream(f)
+        for player_id, match_id in walk_boss_matches(stream):
+            stream.peek()
+            start = stream.tell()
+            match = stream.value()
+            columns["match_id"].append(match_id)
+            columns["player_id"].append(player_id)
+            columns["start_time"].append(int(match["startTime"]))
+            columns["start"].append(start)
+            columns["end"].append(stream.tell())
+    return {
+        "match_id": numpy.array(columns["match_id"], dtype=str),
+        "player_id": numpy.array(columns["player_id"], dtype=numpy.int64),
+        "start_time": numpy.array(columns["start_time"], dtype=numpy.int64),
+        "start": numpy.array(columns["start"], dtype=numpy.int64),
+        "end": numpy.array(columns["end"], dtype=numpy.int64),
+    }
+
+def load_match_index(filename, cache_dir):
+    return load_source_cache(filename, week_cache_file(cache_dir, filename, ".index.npz"), MATCH_INDEX_VERSION, build_match_index)
+
+class MatchIndex:
+    """
+    Random access to single boss matches across many Asgard dumps. The byte
+    offsets of every match are indexed once per dump and cached next to its
+    match table; a lookup is then a dict hit and one slice of the memory
+    mapped dump, whatever the number or size of the dumps.
+    """
+    def __init__(self, history_files, cache_dir):
+        self.files = list(history_files)
+        self.weeks = []
+        self.offsets = {}
+        self.maps = {}
+        for file_idx, filename in enumerate(self.files):
+            index = load_match_index(filename, cache_dir)
+            self.weeks.append(match_table_week(index))
+            for match_id, player_id, start, end in zip(index["match_id"].tolist(), index["player_id"].tolist(), index["start"].tolist(), index["end"].tolist()):
+                self.offsets[match_id] = (file_idx, player_id, start, end)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, match_id):
+        return str(match_id) in self.offsets
+
+    def _map(self, file_idx):
+        if file_idx not in self.maps:
+            with open(self.files[file_idx], "rb") as f:
+                self.maps[file_idx] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[file_idx]
+
+    def lookup(self, match_id):
+        """
+        The match with this id, or None if no dump has it.
+        Output: { match_id:, player_id:, week:, file:, match: $MATCH }
+        """
+        found = self.offsets.get(str(match_id))
+        if found is None:
+            return None
+        file_idx, player_id, start, end = found
+        return {
+            "match_id": str(match_id),
+            "player_id": player_id,
+            "week": self.weeks[file_idx],
+            "file": self.files[file_idx],
+            "match": json.loads(self._map(file_idx)[start:end]),
+        }
+
+    def close(self):
+        for m in self.maps.values():
+            m.close()
+        self.maps = {}
+
+METADATA_CACHE_VERSION = 1
+
+def load_metadata(filename, cache_dir, compile=None):
+    """
+    A YAML metadata file, optionally passed through compile, that is parsed
+    once and then unpickled from cache_dir for as long as the file's content
+    hash is unchanged. Unpickling is much faster than yaml.safe_load and
+    doesn't need yaml imported at all.
+    """
+    fingerprint = file_fingerprint(filename)
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:8]
+    compile_name = "" if compile is None else "." + compile.__name__
+    cache_file = os.path.join(cache_dir, f"{os.path.basename(filename)}-{path_hash}{compile_name}.pickle")
+    try:
+        with open(cache_file, "rb") as f:
+            cache_version, source_sha1, data = pickle.load(f)
+        if cache_version == METADATA_CACHE_VERSION and source_sha1 == fingerprint:
+            return data
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+    with open(filename) as f:
+        data = yaml.safe_load(f)
+    if compile is not None:
+        data = compile(data)
+    os.makedirs(cache_dir, exist_ok=True)
+    with replace_atomically(cache_file) as f:
+        pickle.dump((METADATA_CACHE_VERSION, fingerprint, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return data
+
+DEDUP_VERSION = 1
+
+def dedup_index_file(cache_dir):
+    return os.path.join(cache_dir, "history-dedup.json")
+
+def empty_dedup_index():
+    """
+    {
+        version:,
+        files: {
+            $HISTORY_FILE_PATH: { mtime_ns:, size:, sha1: }
+        },
+        contents: {
+            $SHA1: { match_ids: [] }    # In the order they were first seen
+        }
+    }
+    """
+    return { "version": DEDUP_VERSION, "files": {}, "contents": {} }
+
+def load_dedup_index(index_file):
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return empty_dedup_index()
+    if index.get("version") != DEDUP_VERSION:
+        return empty_dedup_index()
+    return index
+
+def drop_matches(match_table, match_ids):
+    """
+    A week's match table without the given matches. buff_names is shared by
+    all rows, so it's kept whole.
+    """
+    if len(match_ids) == 0:
+        return match_table
+    keep = ~numpy.isin(match_table["match_id"], match_ids)
+    return { column: values if column == "buff_names" else values[keep] for column, values in match_table.items() }
+
+def concat_match_tables(match_tables):
+    """
+    One match table out of several, with each table's buff slots shifted to
+    point into the concatenated buff_names.
+    """
+    if len(match_tables) == 1:
+        return match_tables[0]
+    max_buffs = max(table["buff_slots"].shape[1] for table in match_tables)
+    buff_slots = []
+    buff_values = []
+    buff_offset = 0
+    for table in match_tables:
+        slots = numpy.full((len(table["buff_slots"]), max_buffs), -1, dtype=numpy.int16)
+        values = numpy.zeros((len(table["buff_values"]), max_buffs), dtype=numpy.float64)
+        width = table["buff_slots"].shape[1]
+        slots[:, :width] = numpy.where(table["buff_slots"] >= 0, table["buff_slots"] + buff_offset, -1)
+        values[:, :width] = table["buff_values"]
+        buff_slots.append(slots)
+        buff_values.append(values)
+        buff_offset += len(table["buff_names"])
+    match_table = { column: numpy.concatenate([table[column] for table in match_tables]) for column in match_tables[0] if column not in ["buff_slots", "buff_values"] }
+    match_table["buff_slots"] = numpy.concatenate(buff_slots)
+    match_table["buff_values"] = numpy.concatenate(buff_values)
+    return match_table
+
+@profiled
+def dedup_history(history_files, cache_dir):
+    """
+    The history files with duplicates taken out, as (filename, week file,
+    dropped match ids) in the order given. A file with the same content as
+    another is skipped whole, and a match that is in more than one dump is
+    only kept in the one whose content was seen first. Dumps that share
+    matches are captures of the same week, so each is tagged with the first
+    file of its week. What's dropped is printed.
+
+    Each file's content hash and match ids are kept in a persistent index in
+    cache_dir, and a file is recognized there by path, mtime and size, so a
+    run with no new files opens no dumps.
+    """
+    index_file = dedup_index_file(cache_dir)
+    index = load_dedup_index(index_file)
+    changed = False
+    file_hashes = {}
+    for filename in sorted(history_files):
+        path = os.path.abspath(filename)
+        stat = os.stat(filename)
+        known = index["files"].get(path)
+        if known is None or known["mtime_ns"] != stat.st_mtime_ns or known["size"] != stat.st_size or known["sha1"] not in index["contents"]:
+            fingerprint = file_fingerprint(filename)
+            if fingerprint not in index["contents"]:
+                index["contents"][fingerprint] = { "match_ids": load_week_table(filename, cache_dir)["match_id"].tolist() }
+            known = index["files"][path] = { "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": fingerprint }
+            changed = True
+        file_hashes[filename] = known["sha1"]
+    # Forget files that are gone, and contents no file has any more
+    for path in [path for path in index["files"] if not os.path.exists(path)]:
+        del index["files"][path]
+        changed = True
+    live_hashes = { known["sha1"] for known in index["files"].values() }
+    for fingerprint in [fingerprint for fingerprint in index["contents"] if fingerprint not in live_hashes]:
+        del index["contents"][fingerprint]
+        changed = True
+    if changed:
+        os.makedirs(cache_dir, exist_ok=True)
+        with replace_atomically(index_file, "w") as f:
+            json.dump(index, f)
+
+    hash_files = {}
+    for filename in sorted(history_files):
+        hash_files.setdefault(file_hashes[filename], []).append(filename)
+    kept = {}
+    match_weeks = {}
+    for fingerprint, content in index["contents"].items():
+        filenames = hash_files.get(fingerprint)
+        if filenames is None:
+            continue
+        filename = filenames[0]
+        for duplicate in filenames[1:]:
+            print(f"Skipping {duplicate}: same content as {filename}", file=sys.stderr)
+        match_ids = content["match_ids"]
+        dropped = [match_id for match_id in match_ids if match_id in match_weeks]
+        week_file = match_weeks[dropped[0]] if dropped else filename
+        if dropped:
+            print(f"Dropping {len(dropped)} of {len(match_ids)} matches from {filename}: already in {week_file}", file=sys.stderr)
+        for match_id in match_ids:
+            match_weeks.setdefault(match_id, week_file)
+        kept[filename] = (week_file, dropped)
+    return [(filename,) + kept[filename] for filename in history_files if filename in kept]
+
+def load_history_table(filename, dropped_match_ids, cache_dir):
+    return drop_matches(load_week_table(filename, cache_dir), dropped_match_ids)
+
+def load_history_weeks(history, cache_dir):
+    """
+    One match table per week of the dedup_history output, with the captures
+    of a week merged.
+    """
+    week_files = {}
+    for filename, week_file, dropped_match_ids in history:
+        week_files.setdefault(week_file, []).append((filename, dropped_match_ids))
+    for files in week_files.values():
+        yield concat_match_tables([load_history_table(filename, dropped_match_ids, cache_dir) for filename, dropped_match_ids in files])
+
+ROLLUP_VERSION = 2
+
+def empty_history_rollup():
+    """
+    {
+        version:,
+        weeks: {
+            $HISTORY_FILE_PATH: { mtime_ns:, size:, sha1: }
+        },
+        players: {
+            $PLAYER_ID: {
+                $DIFFICULTY: { max:, sum:, count:, last_week: }
+            }
+        }
+    }
+    """
+    return { "version": ROLLUP_VERSION, "weeks": {}, "players": {} }
+
+def load_history_rollup(rollup_file):
+    try:
+        with open(rollup_file) as f:
+            rollup = json.load(f)
+    except FileNotFoundError:
+        return empty_history_rollup()
+    if rollup.get("version") != ROLLUP_VERSION:
+        return empty_history_rollup()
+    return rollup
+
+def save_history_rollup(rollup_file, rollup):
+    os.makedirs(os.path.dirname(rollup_file) or ".", exist_ok=True)
+    with replace_atomically(rollup_file, "w") as f:
+        json.dump(rollup, f)
+
+def match_table_week(match_table):
+    """
+    The date of the last match in a week's match table, which names the week.
+    """
+    if len(match_table["start_time"]) == 0:
+        return None
+    return datetime.utcfromtimestamp(int(match_table["start_time"].max())).strftime('%Y-%m-%d')
+
+def fold_week_into_rollup(rollup, match_table):
+    """
+    Add one week's per-player, per-difficulty boss damage to the rollup.
+    """
+    week = match_table_week(match_table)
+    if week is None:
+        return
+    week_damages, _ = boss_damage_by_player_difficulty(match_table)
+    fold_week_damages_into_rollup(rollup, week, week_damages)
+
+def fold_week_damages_into_rollup(rollup, week, week_damages):
+    for player_id, player_difficulty_damages in week_damages.items():
+        player_stats = rollup["players"].setdefault(player_id, {})
+        for difficulty, damage in player_difficulty_damages.items():
+            stats = player_stats.setdefault(str(difficulty), { "max": damage, "sum": 0.0, "count": 0, "last_week": week })
+            stats["max"] = max(stats["max"], damage)
+            stats["sum"] += damage
+            stats["count"] += 1
+            stats["last_week"] = max(stats["last_week"], week)
+
+def update_history_rollup(rollup, history, cache_dir):
+    """
+    Fold every history file the rollup hasn't seen yet, out of the
+    dedup_history output. Files are recognized by path, mtime and size,
+    falling back to their content hash, so a run with no new weeks never opens
+    a dump. Returns False if a file that was already folded in has changed
+    content or is gone from the history, or a new file is another capture of
+    a week that was already folded in, since a max can't be unfolded and the
+    rollup then has to be rebuilt from scratch.
+    """
+    folded_hashes = { week["sha1"] for week in rollup["weeks"].values() }
+    folded_paths = set(rollup["weeks"])
+    if not folded_paths <= { os.path.abspath(filename) for filename, _, _ in history }:
+        return False
+    new_weeks = {}
+    for filename, week_file, dropped_match_ids in history:
+        path = os.path.abspath(filename)
+        stat = os.stat(filename)
+        week = rollup["weeks"].get(path)
+        if week is not None and week["mtime_ns"] == stat.st_mtime_ns and week["size"] == stat.st_size:
+            continue
+        fingerprint = file_fingerprint(filename)
+        if week is not None and week["sha1"] != fingerprint:
+            return False
+        if fingerprint not in folded_hashes:
+            if week_file != filename and os.path.abspath(week_file) in folded_paths:
+                return False
+            new_weeks.setdefault(week_file, []).append((filename, dropped_match_ids))
+            folded_hashes.add(fingerprint)
+        rollup["weeks"][path] = { "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": fingerprint }
+    for files in new_weeks.values():
+        fold_week_into_rollup(rollup, concat_match_tables([load_history_table(filename, dropped_match_ids, cache_dir) for filename, dropped_match_ids in files]))
+    return True
+
+@profiled
+def build_history_rollup(history, rollup_file, cache_dir, rebuild=False):
+    rollup = empty_history_rollup() if rebuild else load_history_rollup(rollup_file)
+    if not update_history_rollup(rollup, history, cache_dir):
+        print("A history file changed or was removed after it was summarized; rebuilding the history rollup", file=sys.stderr)
+        rollup = empty_history_rollup()
+        update_history_rollup(rollup, history, cache_dir)
+    save_history_rollup(rollup_file, rollup)
+    return rollup
+
+WEEK_DAMAGES_VERSION = 1
+
+def empty_week_damages():
+    """
+    {
+        weeks: [w], week_files: [w], week_sources: [w],
+        player_ids: [p], difficulties: [d],
+        damages: [p, w, d]
+    }
+    """
+    return {
+        "weeks": numpy.zeros(0, dtype=str),
+        "week_files": numpy.zeros(0, dtype=str),
+        "week_sources": numpy.zeros(0, dtype=str),
+        "player_ids": numpy.zeros(0, dtype=numpy.int64),
+        "difficulties": numpy.zeros(0, dtype=numpy.int64),
+        "damages": numpy.zeros((0, 0, 0)),
+    }
+
+def load_week_damages(week_damages_file):
+    try:
+        with numpy.load(week_damages_file) as cached:
+            cached = dict(cached)
+    except FileNotFoundError:
+        return empty_week_damages()
+    if int(cached.pop("version")) != WEEK_DAMAGES_VERSION:
+        return empty_week_damages()
+    return cached
+
+def save_week_damages(week_damages_file, week_damages):
+    os.makedirs(os.path.dirname(week_damages_file) or ".", exist_ok=True)
+    with replace_atomically(week_damages_file) as f:
+        numpy.savez(f, version=WEEK_DAMAGES_VERSION, **week_damages)
+
+@profiled
+def build_week_damages(history, week_damages_file, cache_dir):
+    """
+    Every player's boss damage at each difficulty in each week of the
+    dedup_history output, stacked into a [players, weeks, difficulties] array
+    with NaN where a player did no damage. It's kept in week_damages_file and
+    updated in place: only the weeks with new or changed files are read, and
+    weeks whose files are gone are dropped. Weeks are in date order.
+    """
+    week_damages = load_week_damages(week_damages_file)
+    week_files = {}
+    for filename, week_file, dropped_match_ids in history:
+        week_files.setdefault(os.path.abspath(week_file), []).append((filename, dropped_match_ids))
+    week_sources = {}
+    for week_file, files in week_files.items():
+        sources = []
+        for filename, _ in files:
+            stat = os.stat(filename)
+            sources.append([os.path.abspath(filename), stat.st_mtime_ns, stat.st_size])
+        week_sources[week_file] = json.dumps(sources)
+
+    kept_weeks = [week_idx for week_idx, (week_file, sources) in enumerate(zip(week_damages["week_files"].tolist(), week_damages["week_sources"].tolist())) if week_sources.get(week_file) == sources]
+    kept_files = { week_damages["week_files"][week_idx] for week_idx in kept_weeks }
+    new_weeks = []
+    for week_file, files in week_files.items():
+        if week_file in kept_files:
+            continue
+        match_table = concat_match_tables([load_history_table(filename, dropped_match_ids, cache_dir) for filename, dropped_match_ids in files])
+        week = match_table_week(match_table)
+        if week is not None:
+            new_weeks.append((week, week_file, boss_damage_by_player_difficulty(match_table)[0]))
+    if len(kept_weeks) == len(week_damages["weeks"]) and len(new_weeks) == 0:
+        return week_damages
+
+    # Players and difficulties only ever get added, so kept weeks keep their indexes
+    player_idxs = { player_id: player_idx for player_idx, player_id in enumerate(week_damages["player_ids"].tolist()) }
+    difficulties = set(week_damages["difficulties"].tolist())
+    for _, _, damages in new_weeks:
+        for player_id, player_difficulty_damages in damages.items():
+            player_idxs.setdefault(int(player_id), len(player_idxs))
+            difficulties.update(player_difficulty_damages)
+    difficulties = sorted(difficulties)
+    difficulty_idxs = { difficulty: difficulty_idx for difficulty_idx, difficulty in enumerate(difficulties) }
+    old_damages = week_damages["damages"]
+    array = numpy.full((len(player_idxs), len(kept_weeks) + len(new_weeks), len(difficulties)), numpy.nan)
+    array[numpy.ix_(
+        numpy.arange(old_damages.shape[0]),
+        numpy.arange(len(kept_weeks)),
+        numpy.array([difficulty_idxs[difficulty] for difficulty in week_damages["difficulties"].tolist()], dtype=numpy.int64))] = old_damages[:, kept_weeks]
+    for week_idx, (_, _, damages) in enumerate(new_weeks, start=len(kept_weeks)):
+        for player_id, player_difficulty_damages in damages.items():
+            for difficulty, damage in player_difficulty_damages.items():
+                # Every match counts toward the next difficulty too, usually with no damage
+                if damage > 0:
+                    array[player_idxs[int(player_id)], week_idx, difficulty_idxs[difficulty]] = damage
+
+    weeks = week_damages["weeks"][kept_weeks].tolist() + [week for week, _, _ in new_weeks]
+    files = week_damages["week_files"][kept_weeks].tolist() + [week_file for _, week_file, _ in new_weeks]
+    order = numpy.argsort(numpy.array(weeks, dtype=str), kind="stable")
+    week_damages = {
+        "weeks": numpy.array(weeks, dtype=str)[order],
+        "week_files": numpy.array(files, dtype=str)[order],
+        "week_sources": numpy.array([week_sources[week_file] for week_file in files], dtype=str)[order],
+        "player_ids": numpy.array(list(player_idxs.keys()), dtype=numpy.int64),
+        "difficulties": numpy.array(difficulties, dtype=numpy.int64),
+        "damages": array[:, order],
+    }
+    save_week_damages(week_damages_file, week_damages)
+    return week_damages
+
+STORE_VERSION = 2
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weeks (
+    week_id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    week TEXT,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha1 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS players (
+    player_id INTEGER PRIMARY KEY,
+    name TEXT
+);
+-- week_id is the first week the match was ingested from, which cross-week queries count it under
+CREATE TABLE IF NOT EXISTS matches (
+    match_id INTEGER PRIMARY KEY,
+    week_id INTEGER NOT NULL REFERENCES weeks,
+    player_id INTEGER NOT NULL REFERENCES players,
+    start_time INTEGER NOT NULL,
+    difficulty INTEGER NOT NULL,
+    damage_taken INTEGER NOT NULL,
+    damage_taken_next_level INTEGER NOT NULL
+);
+-- Every match of each week's dump, in its row order, including ones first ingested from another dump
+CREATE TABLE IF NOT EXISTS week_matches (
+    week_id INTEGER NOT NULL REFERENCES weeks,
+    match_id INTEGER NOT NULL REFERENCES matches,
+    week_row INTEGER NOT NULL,
+    PRIMARY KEY (week_id, week_row)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS attackers (
+    match_id INTEGER NOT NULL REFERENCES matches,
+    slot INTEGER NOT NULL,
+    hero_id INTEGER NOT NULL,
+    color INTEGER,
+    power INTEGER,
+    hp REAL,
+    strength REAL,
+    magic_penetration REAL,
+    armor_penetration REAL,
+    favor_pet_id INTEGER,
+    favor_power INTEGER,
+    PRIMARY KEY (match_id, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS buffs (
+    match_id INTEGER NOT NULL REFERENCES matches,
+    slot INTEGER NOT NULL,
+    buff_id TEXT NOT NULL,
+    name TEXT,
+    value REAL NOT NULL,
+    PRIMARY KEY (match_id, slot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS weeks_week ON weeks (week);
+CREATE INDEX IF NOT EXISTS matches_week ON matches (week_id);
+CREATE INDEX IF NOT EXISTS week_matches_match ON week_matches (match_id);
+CREATE INDEX IF NOT EXISTS matches_player ON matches (player_id);
+CREATE INDEX IF NOT EXISTS matches_difficulty ON matches (difficulty);
+CREATE INDEX IF NOT EXISTS attackers_hero ON attackers (hero_id);
+CREATE INDEX IF NOT EXISTS buffs_name ON buffs (name);
+"""
+
+# Columns of the attackers table, in MATCH_TABLE_ATTACKER_STATS order
+STORE_ATTACKER_COLUMNS = ["hero_id", "color", "power", "hp", "strength", "magic_penetration", "armor_penetration", "favor_pet_id", "favor_power"]
+
+def open_match_store(filename):
+    """
+    Open the SQLite match store, creating it if needed. Every match of every
+    ingested dump is a row of matches, with its heroes and pet in attackers
+    and its buffs in buffs, so questions across weeks are a query away.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    store = sqlite3.connect(filename, timeout=60)
+    store.execute("PRAGMA journal_mode = WAL")
+    version = store.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        with store:
+            store.executescript(STORE_SCHEMA)
+            store.execute(f"PRAGMA user_version = {STORE_VERSION}")
+    elif version != STORE_VERSION:
+        raise Exception(f"Match store {filename} has version {version}, expected {STORE_VERSION}; delete it to re-ingest")
+    return store
+
+@profiled
+def ingest_week(store, filename, cache_dir, guild_roster, buff_data):
+    """
+    Add one Asgard dump to the match store in a single transaction, and return
+    its week_id. A dump already ingested with the same mtime and size isn't
+    read again. Matches are keyed by match id, so a changed or overlapping dump
+    only adds the matches that are new, and week_matches links the week to all
+    of its matches.
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(filename)
+    known = store.execute("SELECT week_id, mtime_ns, size FROM weeks WHERE filename = ?", (path,)).fetchone()
+    if known is not None and known[1:] == (stat.st_mtime_ns, stat.st_size):
+        return known[0]
+    match_table = load_week_table(filename, cache_dir)
+    match_ids = match_table["match_id"].tolist()
+    week_values = (match_table_week(match_table), stat.st_mtime_ns, stat.st_size, file_fingerprint(filename))
+    with store:
+        if known is None:
+            week_id = store.execute("INSERT INTO weeks (week, mtime_ns, size, sha1, filename) VALUES (?, ?, ?, ?, ?)", week_values + (path,)).lastrowid
+        else:
+            week_id = known[0]
+            store.execute("UPDATE weeks SET week = ?, mtime_ns = ?, size = ?, sha1 = ? WHERE week_id = ?", week_values + (week_id,))
+        player_ids = set(match_table["player_id"].tolist())
+        store.executemany("INSERT OR REPLACE INTO players (player_id, name) VALUES (?, ?)",
+            [(int(player_id), guild_roster.name(player_id)) for player_id in guild_roster.members if int(player_id) in player_ids])
+        store.executemany("INSERT OR IGNORE INTO players (player_id) VALUES (?)", [(player_id,) for player_id in player_ids])
+        store.executemany("INSERT OR IGNORE INTO matches (match_id, week_id, player_id, start_time, difficulty, damage_taken, damage_taken_next_level) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(match_ids,
+                itertools.repeat(week_id),
+                match_table["player_id"].tolist(),
+                match_table["start_time"].tolist(),
+                match_table["level"].tolist(),
+                match_table["damage_taken"].tolist(),
+                match_table["damage_taken_next_level"].tolist()))
+        store.execute("DELETE FROM week_matches WHERE week_id = ?", (week_id,))
+        store.executemany("INSERT INTO week_matches (week_id, match_id, week_row) VALUES (?, ?, ?)",
+            zip(itertools.repeat(week_id), match_ids, itertools.count()))
+        attacker_columns = [match_table[column].tolist() for column, _, _ in MATCH_TABLE_ATTACKER_STATS]
+        store.executemany(f"INSERT OR IGNORE INTO attackers (match_id, slot, {', '.join(STORE_ATTACKER_COLUMNS)}) VALUES ({', '.join(['?'] * (len(STORE_ATTACKER_COLUMNS) + 2))})",
+            [(match_id, slot) + tuple(column[row][slot] for column in attacker_columns)
+             for row, match_id in enumerate(match_ids)
+             for slot in range(MAX_TEAM_HEROES + 1)
+             if attacker_columns[0][row][slot] != 0])
+        buff_names = match_table["buff_names"].tolist()
+        store.executemany("INSERT OR IGNORE INTO buffs (match_id, slot, buff_id, name, value) VALUES (?, ?, ?, ?, ?)",
+            [(match_id, slot, buff_names[buff_idx], (lookup_buff(buff_data, buff_names[buff_idx]) or (None,))[0], value)
+             for match_id, buff_slots, buff_values in zip(match_ids, match_table["buff_slots"].tolist(), match_table["buff_values"].tolist())
+             for slot, (buff_idx, value) in enumerate(zip(buff_slots, buff_values))
+             if buff_idx >= 0])
+    return week_id
+
+def ingest_history(store, history, cache_dir, guild_roster, buff_data):
+    # Matches are keyed by match id, so the store keeps one copy of the duplicate ones itself
+    for filename, _, _ in history:
+        ingest_week(store, filename, cache_dir, guild_roster, buff_data)
+
+@profiled
+def store_match_table(store, week_id):
+    """
+    Rebuild a week's match table from the match store, in the row order of its
+    dump. Its matches are read through week_matches, since ones it shares with
+    a dump ingested earlier were stored under that first week.
+    """
+    rows = store.execute("SELECT m.player_id, m.match_id, m.start_time, m.difficulty, m.damage_taken, m.damage_taken_next_level FROM week_matches wm JOIN matches m USING (match_id) WHERE wm.week_id = ? ORDER BY wm.week_row", (week_id,)).fetchall()
+    match_table = {}
+    for column, values, dtype in zip(
+            ["player_id", "match_id", "start_time", "level", "damage_taken", "damage_taken_next_level"],
+            zip(*rows) if rows else [[]] * 6,
+            [numpy.int64, numpy.int64, numpy.int64, numpy.int32, numpy.int64, numpy.int64]):
+        match_table[column] = numpy.array(values, dtype=dtype)
+    match_rows = { match_id: row for row, match_id in enumerate(match_table["match_id"].tolist()) }
+    for column, _, dtype in MATCH_TABLE_ATTACKER_STATS:
+        match_table[column] = numpy.zeros((len(rows), MAX_TEAM_HEROES + 1), dtype=dtype)
+    for match_id, slot, *stats in store.execute(f"SELECT a.match_id, a.slot, {', '.join('a.' + column for column in STORE_ATTACKER_COLUMNS)} FROM attackers a JOIN week_matches wm USING (match_id) WHERE wm.week_id = ?", (week_id,)):
+        row = match_rows[match_id]
+        for (column, _, _), stat in zip(MATCH_TABLE_ATTACKER_STATS, stats):
+            match_table[column][row, slot] = stat
+    buff_rows = sorted((match_rows[match_id], slot, buff_id, value) for match_id, slot, buff_id, value in
+        store.execute("SELECT b.match_id, b.slot, b.buff_id, b.value FROM buffs b JOIN week_matches wm USING (match_id) WHERE wm.week_id = ?", (week_id,)))
+    buff_idxs = {}
+    max_buffs = max((slot + 1 for _, slot, _, _ in buff_rows), default=0)
+    match_table["buff_slots"] = numpy.full((len(rows), max_buffs), -1, dtype=numpy.int16)
+    match_table["buff_values"] = numpy.zeros((len(rows), max_buffs), dtype=numpy.float64)
+    for row, slot, buff_id, value in buff_rows:
+        match_table["buff_slots"][row, slot] = buff_idxs.setdefault(buff_id, len(buff_idxs))
+        match_table["buff_values"][row, slot] = value
+    match_table["buff_names"] = numpy.array(list(buff_idxs.keys()), dtype=str)
+    return match_table
+
+@profiled
+def store_history_rollup(store):
+    """
+    The same per-player, per-difficulty history rollup as build_history_rollup,
+    aggregated by the match store instead of folded week by week.
+    """
+    rollup = empty_history_rollup()
+    for filename, mtime_ns, size, sha1 in store.execute("SELECT filename, mtime_ns, size, sha1 FROM weeks"):
+        rollup["weeks"][filename] = { "mtime_ns": mtime_ns, "size": size, "sha1": sha1 }
+    week_damages = {}
+    for week, player_id, difficulty, damage_taken, damage_taken_next_level in store.execute("""
+            SELECT w.week, m.player_id, m.difficulty, SUM(m.damage_taken), SUM(m.damage_taken_next_level)
+            FROM matches m JOIN weeks w USING (week_id)
+            GROUP BY m.week_id, m.player_id, m.difficulty
+            ORDER BY m.week_id"""):
+        player_damages = week_damages.setdefault(week, {}).setdefault(str(player_id), {})
+        for difficulty, damage in [(difficulty, damage_taken), (next_difficulty(difficulty), damage_taken_next_level)]:
+            player_damages[difficulty] = player_damages.get(difficulty, 0.0) + damage
+    for week, damages in week_damages.items():
+        fold_week_damages_into_rollup(rollup, week, damages)
+    return rollup
+
+def json_scalar(value):
+    """json.dumps default for the numpy scalars pages write."""
+    return value.item()
+
+class FlatWorksheet:
+    """
+    Streams one page row by row to emit. Like xlsxwriter's constant_memory
+    mode, rows have to be written in order and only the current row is held
+    in memory. Formats are ignored.
+    """
+    def __init__(self, emit):
+        self.emit = emit
+        self.row = -1
+        self.cells = []
+
+    def flush(self):
+        if self.row >= 0:
+            self.emit(self.cells)
+        self.cells = []
+
+    def write(self, row, col, value, format=None):
+        if row < self.row:
+            raise Exception(f"Rows must be written in order: row {row} after row {self.row}")
+        while self.row < row:
+            self.flush()
+            self.row += 1
+        self.cells.extend([None] * (col + 1 - len(self.cells)))
+        self.cells[col] = value
+
+    def write_row(self, row, col, values, format=None):
+        for i, value in enumerate(values):
+            self.write(row, col + i, value, format)
+
+class FlatReport:
+    """
+    Stand-in for an xlsxwriter Workbook that writes every page as its own csv
+    or jsonl file in a directory named after the report.
+    """
+    def __init__(self, filename, output_format):
+        self.filename = filename
+        self.output_format = output_format
+        self.worksheets = []
+        self.files = []
+        os.makedirs(filename, exist_ok=True)
+
+    def add_worksheet(self, name):
+        f = open(os.path.join(self.filename, f"{name}.{self.output_format}"), "w", newline="")
+        if self.output_format == "csv":
+            emit = csv.writer(f).writerow
+        else:
+            emit = lambda cells: f.write(json.dumps(cells, default=json_scalar) + "\n")
+        worksheet = FlatWorksheet(emit)
+        self.worksheets.append(worksheet)
+        self.files.append(f)
+        return worksheet
+
+    def add_format(self, properties):
+        return None
+
+    def close(self):
+        for worksheet in self.worksheets:
+            worksheet.flush()
+        for f in self.files:
+            f.close()
+
+class MemoryReport:
+    """
+    Stand-in for an xlsxwriter Workbook that keeps the rows of every page in
+    memory, as { worksheet name: [rows] }, for the report server.
+    """
+    def __init__(self):
+        self.rows = {}
+        self.worksheets = []
+
+    def add_worksheet(self, name):
+        worksheet = FlatWorksheet(self.rows.setdefault(name, []).append)
+        self.worksheets.append(worksheet)
+        return worksheet
+
+    def add_format(self, properties):
+        return None
+
+    def close(self):
+        for worksheet in self.worksheets:
+            worksheet.flush()
+
+def open_report(basename, output_format):
+    """
+    Workbook-like report writer. Every page writes its rows in order, so the
+    xlsx backend can run in xlsxwriter's constant_memory mode.
+    """
+    os.makedirs(os.path.dirname(basename) or ".", exist_ok=True)
+    if output_format == "xlsx":
+        return xlsxwriter.Workbook(basename + ".xlsx", {'constant_memory': True})
+    return FlatReport(basename, output_format)
+
+def read_asgard_timestamp(filename):
+    """
+    The "date" of an Asgard dump, without parsing the rest of it.
+    """
+    with open(filename) as f:
+        stream = JsonStream(f)
+        for key in stream.items():
+            if key == "date":
+                return stream.value()
+            stream.skip()
+    raise Exception("No date in Asgard file " + filename)
+
+def read_asgard_summary(filename):
+    """
+    The summary section of an Asgard dump, without parsing its matches.
+    """
+    with open(filename) as f:
+        stream = JsonStream(f)
+        for key in stream.items():
+            if key != "results":
+                stream.skip()
+                continue
+            for section in stream.elements():
+                summary_data = stream.value()
+                # Some dumps start with an extra { result: { response: [true] } } section
+                if section > 0 or not isinstance(summary_data["result"]["response"], list):
+                    return summary_data
+    raise Exception("No summary in Asgard file " + filename)
+
+def load_timestamp_input(inputs):
+    if "asgard_data" in inputs.values:
+        return inputs.values["asgard_data"][0]
+    return read_asgard_timestamp(inputs.asgard_file)
+
+def load_summary_data_input(inputs):
+    if "asgard_data" in inputs.values:
+        return inputs.values["asgard_data"][1]
+    return read_asgard_summary(inputs.asgard_file)
+
+def load_guild_roster_input(inputs):
+    with open(inputs.args.guild_file) as f:
+        return GuildRoster(json.load(f))
+
+def load_hero_data_input(inputs):
+    return load_metadata(inputs.args.heroes_file, inputs.args.cache_dir)
+
+def load_buff_data_input(inputs):
+    return load_metadata(inputs.args.buff_file, inputs.args.cache_dir, compile_buff_data)
+
+def load_boss_data_input(inputs):
+    return load_metadata(inputs.args.boss_file, inputs.args.cache_dir)
+
+def load_match_table_input(inputs):
+    args = inputs.args
+    if args.store is not None:
+        week_id = ingest_week(inputs["store"], inputs.asgard_file, args.cache_dir, inputs["guild_roster"], inputs["buff_data"])
+        return store_match_table(inputs["store"], week_id)
+    # The week being converted is usually in the history cache already
+    return load_week_table(inputs.asgard_file, args.cache_dir)
+
+def load_history_rollup_input(inputs):
+    args = inputs.args
+    if args.store is not None:
+        ingest_history(inputs["store"], inputs["history_files"], args.cache_dir, inputs["guild_roster"], inputs["buff_data"])
+        return store_history_rollup(inputs["store"])
+    return build_history_rollup(inputs["history_files"], args.rollup_file, args.cache_dir, rebuild=args.rebuild_history)
+
+def load_hero_attribution_input(inputs):
+    return fit_hero_attribution(
+        inputs["history"],
+        inputs["hero_data"],
+        ridge=inputs.args.attribution_ridge,
+        num_bootstrap=inputs.args.attribution_bootstrap)
+
+# Input name => loader. Loaders pull whatever they depend on from the inputs.
+INPUT_LOADERS = {
+    "asgard_data": lambda inputs: read_asgard_data_json(inputs.asgard_file),
+    "timestamp": load_timestamp_input,
+    "summary_data": load_summary_data_input,
+    "match_table": load_match_table_input,
+    "store": lambda inputs: open_match_store(inputs.args.store),
+    "guild_roster": load_guild_roster_input,
+    "hero_data": load_hero_data_input,
+    "buff_data": load_buff_data_input,
+    "boss_data": load_boss_data_input,
+    "history_rollup": load_history_rollup_input,
+    "week_damages": lambda inputs: build_week_damages(inputs["history_files"], inputs.args.week_damages_file, inputs.args.cache_dir),
+    "history_files": lambda inputs: dedup_history(glob.glob(inputs.args.history_format), inputs.args.cache_dir),
+    "history": lambda inputs: compact_history(load_history_weeks(inputs["history_files"], inputs.args.cache_dir)),
+    "hero_attribution": load_hero_attribution_input,
+    "team_synergy": lambda inputs: fit_team_synergy(inputs["history"], inputs["hero_attribution"]),
+    "workers": lambda inputs: inputs.args.workers,
+}
+
+# Inputs that don't depend on which week is being converted
+SHARED_INPUTS = ["guild_roster", "hero_data", "buff_data", "boss_data", "history_rollup", "week_damages", "history", "hero_attribution", "team_synergy"]
+# Inputs that are also the same for every guild of a --guilds run
+GUILD_SHARED_INPUTS = ["hero_data", "buff_data", "boss_data"]
+
+# Page name => (page builder, inputs passed after the workbook), in workbook order
+PAGES = {
+    "summaries": (add_damage_summaries_page, ["summary_data", "match_table", "guild_roster"]),
+    "detail": (add_match_detail_page, ["match_table", "guild_roster", "hero_data"]),
+    "buffs": (add_buff_summary_page, ["match_table", "guild_roster", "hero_data", "buff_data"]),
+    "heroes": (add_hero_summary_page, ["match_table", "hero_data"]),
+    "teams": (add_team_summary_page, ["match_table", "guild_roster", "hero_data", "buff_data", "boss_data"]),
+    "rosters": (add_roster_teams_page, ["match_table", "guild_roster", "hero_data", "boss_data"]),
+    "recommend": (add_team_recommendation_page, ["match_table", "guild_roster", "hero_data", "hero_attribution", "team_synergy", "workers"]),
+    "history": (add_history_summary_page, ["history_rollup", "guild_roster"]),
+    "trends": (add_player_trends_page, ["week_damages", "guild_roster"]),
+    "leaderboards": (add_leaderboard_page, ["history", "guild_roster", "hero_data"]),
+    "attribution": (add_hero_attribution_page, ["hero_attribution", "hero_data"]),
+}
+
+class ReportInputs:
+    """
+    The inputs of the report pages, each loaded the first time a page asks
+    for it, so a run only pays for the files its selected pages need.
+    """
+    def __init__(self, args, asgard_file=None, **values):
+        self.args = args
+        self.asgard_file = asgard_file
+        self.values = values
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            with profile_stage("load " + name):
+                self.values[name] = INPUT_LOADERS[name](self)
+        return self.values[name]
+
+def load_shared_inputs(shared_inputs, pages, names=SHARED_INPUTS):
+    for name in names:
+        if any(name in PAGES[page][1] for page in pages):
+            shared_inputs[name]
+
+def shared_values(shared_inputs, names=SHARED_INPUTS):
+    """
+    The loaded shared inputs, leaving out ones like the match store connection
+    that can't be handed to another process.
+    """
+    return { name: value for name, value in shared_inputs.values.items() if name in names }
+
+def parse_pages(pages):
+    selected = pages.split(",")
+    for page in selected:
+        if page not in PAGES:
+            parser.error(f"unknown page {page}, expected some of {','.join(PAGES)}")
+    return [page for page in PAGES if page in selected]
+
+@profiled
+def convert_json_to_xlsx(inputs, pages=PAGES, output_format="xlsx"):
+    workbook = open_report(os.path.join(inputs.args.output_dir, datetime.utcfromtimestamp(inputs["timestamp"]).strftime('Asgard-%Y-%m-%dT%H:%M:%S')), output_format)
+    for page in pages:
+        add_page, page_inputs = PAGES[page]
+        add_page(workbook, *[inputs[name] for name in page_inputs])
+    with profile_stage("workbook.close"):
+        workbook.close()
+    return workbook.filename
+
+# Inputs shared by every week of a --batch run, set once per worker process
+batch_context = {}
+
+def init_batch_worker(args, shared_values, pages):
+    batch_context.update(args=args, shared_values=shared_values, pages=pages)
+
+def convert_batch_week(asgard_file):
+    start = time.perf_counter()
+    args = batch_context["args"]
+    # Weeks are already spread over the pool, so pages don't start pools of their own
+    inputs = ReportInputs(args, asgard_file, workers=1, **batch_context["shared_values"])
+    output_file = convert_json_to_xlsx(inputs, batch_context["pages"], args.output_format)
+    return output_file, time.perf_counter() - start
+
+def convert_batch(asgard_files, args, shared_inputs, pages):
+    """
+    Convert every week on a process pool. Inputs that are the same for every
+    week are loaded once here and handed to each worker when it starts.
+    """
+    start = time.perf_counter()
+    load_shared_inputs(shared_inputs, pages)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker, initargs=(args, shared_values(shared_inputs), pages)) as executor:
+        for asgard_file, (output_file, elapsed) in zip(asgard_files, executor.map(convert_batch_week, asgard_files)):
+            print(f"{asgard_file} -> {output_file}: {elapsed:.2f}s")
+    print(f"Converted {len(asgard_files)} Asgard files in {time.perf_counter() - start:.2f}s")
+
+def read_guild_manifest(manifest_file):
+    """
+    Guild directories listed in a YAML manifest, relative to the manifest.
+    Each holds its own guild.json and asgard-*.json files.
+    - alliance/guild-one
+    - alliance/guild-two
+    """
+    with open(manifest_file) as f:
+        guild_dirs = yaml.safe_load(f)
+    return [os.path.join(os.path.dirname(manifest_file), guild_dir) for guild_dir in guild_dirs]
+
+def guild_args(args, guild_dir):
+    """
+    The command line arguments, pointed at one guild's directory. Its caches
+    go in that directory too, and its reports in a directory of --output_dir
+    named after it.
+    """
+    guild_args = argparse.Namespace(**vars(args))
+    guild_args.guild_file = os.path.join(guild_dir, "guild.json")
+    guild_args.history_format = os.path.join(guild_dir, "asgard-*.json")
+    guild_args.cache_dir = os.path.join(guild_dir, "cache")
+    guild_args.rollup_file = os.path.join(guild_dir, "cache", "history-rollup.json")
+    guild_args.week_damages_file = os.path.join(guild_dir, "cache", "history-week-damages.npz")
+    guild_args.output_dir = os.path.join(args.output_dir, os.path.basename(os.path.normpath(guild_dir)))
+    if args.store is not None:
+        guild_args.store = os.path.join(guild_dir, "cache", os.path.basename(args.store))
+    return guild_args
+
+def convert_guild(guild_dir):
+    """
+    Build the report of a guild's latest week. Returns the guild's name, the
+    report, the week's timestamp, its per-player, per-difficulty damage, and
+    the time it took.
+    """
+    start = time.perf_counter()
+    args = guild_args(batch_context["args"], guild_dir)
+    asgard_files = sorted(glob.glob(args.history_format))
+    if len(asgard_files) == 0:
+        raise Exception("No Asgard files in " + guild_dir)
+    # Guilds are already spread over the pool, so pages don't start pools of their own
+    inputs = ReportInputs(args, asgard_files[-1], workers=1, **batch_context["shared_values"])
+    output_file = convert_json_to_xlsx(inputs, batch_context["pages"], args.output_format)
+    damages, _ = boss_damage_by_player_difficulty(inputs["match_table"])
+    name = inputs["guild_roster"].title or os.path.basename(os.path.normpath(guild_dir))
+    return name, output_file, inputs["timestamp"], damages, time.perf_counter() - start
+
+GUILD_COMPARISON_PERCENTILES = [10, 25, 50, 75, 90]
+
+@profiled
+def add_guild_comparison_page(workbook, guild_damages):
+    """
+    Output: Guild|Difficulty|Players|10th Percentile|...|90th Percentile|Max
+    Spread of the per-player damage of each guild at each difficulty.
+    Input: [(guild name, { player_id: { difficulty: damage } })]
+    """
+    worksheet = workbook.add_worksheet("Guild Comparison")
+    format_integer = workbook.add_format({'num_format': 1})
+    worksheet.write_row(0, 0, ["Guild", "Difficulty", "Players"] + [f"{percentile}th Percentile" for percentile in GUILD_COMPARISON_PERCENTILES] + ["Max"])
+    row_id = 1
+    for name, damages in guild_damages:
+        difficulty_damages = {}
+        for player_difficulty_damages in damages.values():
+            for difficulty, damage in player_difficulty_damages.items():
+                if damage > 0:
+                    difficulty_damages.setdefault(difficulty, []).append(damage)
+        for difficulty in sorted(difficulty_damages):
+            player_damages = numpy.array(difficulty_damages[difficulty])
+            worksheet.write_row(row_id, 0, [name, difficulty, len(player_damages)])
+            worksheet.write_row(row_id, 3, numpy.percentile(player_damages, GUILD_COMPARISON_PERCENTILES).tolist() + [player_damages.max()], format_integer)
+            row_id += 1
+
+def convert_guilds(guild_dirs, args, shared_inputs, pages):
+    """
+    Build every guild's report on a process pool, loading the hero, buff and
+    boss files once for all of them, then compare the guilds in a report of
+    their own.
+    """
+    start = time.perf_counter()
+    output_dirs = [guild_args(args, guild_dir).output_dir for guild_dir in guild_dirs]
+    for output_dir in set(output_dirs):
+        if output_dirs.count(output_dir) > 1:
+            raise Exception(f"More than one guild directory would write its reports to {output_dir}")
+    load_shared_inputs(shared_inputs, pages, GUILD_SHARED_INPUTS)
+    guild_damages = []
+    timestamps = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker, initargs=(args, shared_values(shared_inputs, GUILD_SHARED_INPUTS), pages)) as executor:
+        for guild_dir, (name, output_file, timestamp, damages, elapsed) in zip(guild_dirs, executor.map(convert_guild, guild_dirs)):
+            print(f"{guild_dir} ({name}) -> {output_file}: {elapsed:.2f}s")
+            guild_damages.append((name, damages))
+            timestamps.append(timestamp)
+    workbook = open_report(os.path.join(args.output_dir, datetime.utcfromtimestamp(max(timestamps)).strftime('Asgard-Guilds-%Y-%m-%dT%H:%M:%S')), args.output_format)
+    add_guild_comparison_page(workbook, guild_damages)
+    workbook.close()
+    print(f"Compared {len(guild_dirs)} guilds in {workbook.filename}: {time.perf_counter() - start:.2f}s")
+
+def poll_history_files(history_format):
+    ret = {}
+    for filename in glob.glob(history_format):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            continue
+        ret[filename] = (stat.st_mtime_ns, stat.st_size)
+    return ret
+
+def refresh_history_inputs(shared_inputs):
+    """
+    Fold new weeks into the in-memory history rollup, and drop what has to be
+    recomputed from the whole history so it's rebuilt the next time a page asks.
+    """
+    args = shared_inputs.args
+    shared_inputs.values.pop("history_files", None)
+    rollup = shared_inputs.values.get("history_rollup")
+    if rollup is not None and args.store is not None:
+        del shared_inputs.values["history_rollup"]
+    elif rollup is not None:
+        if update_history_rollup(rollup, shared_inputs["history_files"], args.cache_dir):
+            save_history_rollup(args.rollup_file, rollup)
+        else:
+            del shared_inputs.values["history_rollup"]
+    for name in ["history", "week_damages", "hero_attribution", "team_synergy"]:
+        shared_inputs.values.pop(name, None)
+
+def watch_history(shared_inputs, pages):
+    """
+    Poll the history files and rebuild the report of every dump that is added
+    or changed, keeping the metadata and history loaded between rebuilds. A
+    dump is only picked up once its mtime and size have held still for a whole
+    poll, so one still being written isn't read half finished.
+    """
+    args = shared_inputs.args
+    load_shared_inputs(shared_inputs, pages)
+    seen = poll_history_files(args.history_format)
+    pending = {}
+    print(f"Watching {args.history_format}")
+    while True:
+        time.sleep(args.watch_interval)
+        current = poll_history_files(args.history_format)
+        changed = { filename: stat for filename, stat in current.items() if seen.get(filename) != stat }
+        ready = sorted(filename for filename, stat in changed.items() if pending.get(filename) == stat)
+        pending = changed
+        for filename in ready:
+            seen[filename] = current[filename]
+            del pending[filename]
+            start = time.perf_counter()
+            try:
+                refresh_history_inputs(shared_inputs)
+                output_file = convert_json_to_xlsx(ReportInputs(args, filename, **shared_inputs.values), pages, args.output_format)
+            except Exception as e:
+                print(f"{filename}: {e}")
+                continue
+            print(f"{filename} -> {output_file}: {time.perf_counter() - start:.2f}s")
+
+# Input name => the groups of source files it's computed from
+INPUT_SOURCES = {
+    "asgard_data": ["week"],
+    "timestamp": ["week"],
+    "summary_data": ["week"],
+    "match_table": ["week"],
+    "guild_roster": ["guild"],
+    "hero_data": ["heroes"],
+    "buff_data": ["buffs"],
+    "boss_data": ["boss"],
+    "history_rollup": ["history"],
+    "week_damages": ["history"],
+    "history": ["history"],
+    "hero_attribution": ["history", "heroes"],
+    "team_synergy": ["history", "heroes"],
+}
+# Source file group => the shared inputs to drop when its files change
+SOURCE_INPUTS = {
+    "guild": ["guild_roster"],
+    "heroes": ["hero_data", "hero_attribution", "team_synergy"],
+    "buffs": ["buff_data"],
+    "boss": ["boss_data"],
+    "history": ["history_files", "history_rollup", "week_damages", "history", "hero_attribution", "team_synergy"],
+}
+
+class ReportServer:
+    """
+    Renders pages on demand for --serve. Rendered pages are kept in an LRU
+    cache keyed by the content hashes of the files each page is computed
+    from, so a changed week, guild file or YAML only misses the pages that
+    read it. The shared inputs stay loaded between requests, and the ones
+    whose files changed are dropped and reloaded when a page next needs them.
+    """
+    def __init__(self, shared_inputs, pages, cache_pages):
+        self.args = shared_inputs.args
+        self.shared_inputs = shared_inputs
+        self.pages = pages
+        self.cache_pages = cache_pages
+        self.cache = collections.OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.inputs_lock = threading.Lock()
+        # Cache key => future of the render in progress, so concurrent requests of a page wait on one render
+        self.renders = {}
+        # Week file => lock held while its inputs are parsed, so concurrent requests parse a week once
+        self.week_locks = {}
+        # A match store connection can only be used by the thread that opened it, so each pool thread keeps its own
+        self.thread_stores = threading.local()
+        # Path => (mtime_ns, size, sha1), so unchanged files aren't hashed again
+        self.fingerprints = {}
+        # Source file group => fingerprints of its files when its shared inputs were loaded
+        self.loaded_sources = {}
+
+    def week_files(self):
+        files = glob.glob(self.args.history_format)
+        if self.args.asgard_file is not None:
+            files.append(self.args.asgard_file)
+        return { os.path.splitext(os.path.basename(filename))[0]: filename for filename in sorted(files) }
+
+    def source_files(self, group, asgard_file):
+        args = self.args
+        if group == "week":
+            return [asgard_file]
+        if group == "history":
+            return sorted(glob.glob(args.history_format))
+        return [{ "guild": args.guild_file, "heroes": args.heroes_file, "buffs": args.buff_file, "boss": args.boss_file }[group]]
+
+    def fingerprint(self, filename):
+        stat = os.stat(filename)
+        known = self.fingerprints.get(filename)
+        if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+            known = self.fingerprints[filename] = (stat.st_mtime_ns, stat.st_size, file_fingerprint(filename))
+        return known[2]
+
+    def page_sources(self, page, asgard_file):
+        groups = sorted({ group for name in PAGES[page][1] for group in INPUT_SOURCES.get(name, []) })
+        return tuple((group, tuple(self.fingerprint(filename) for filename in self.source_files(group, asgard_file))) for group in groups)
+
+    def thread_store(self):
+        store = getattr(self.thread_stores, "store", None)
+        if store is None:
+            store = self.thread_stores.store = open_match_store(self.args.store)
+        return store
+
+    def page_inputs(self, page, asgard_file, sources):
+        stores = { "store": self.thread_store() } if self.args.store is not None else {}
+        with self.inputs_lock:
+            for group, fingerprints in sources:
+                if group == "week" or self.loaded_sources.get(group) == fingerprints:
+                    continue
+                for name in SOURCE_INPUTS[group]:
+                    self.shared_inputs.values.pop(name, None)
+                self.loaded_sources[group] = fingerprints
+            self.shared_inputs.values.update(stores)
+            for name in PAGES[page][1]:
+                if name in SHARED_INPUTS:
+                    self.shared_inputs[name]
+            self.shared_inputs.values.pop("store", None)
+            values = shared_values(self.shared_inputs)
+            week_lock = self.week_locks.setdefault(asgard_file, threading.Lock())
+        inputs = ReportInputs(self.args, asgard_file, workers=1, **values, **stores)
+        # The first request parses the week and writes its cache, which the ones waiting then read
+        with week_lock:
+            for name in PAGES[page][1]:
+                if name not in SHARED_INPUTS:
+                    inputs[name]
+        return inputs
+
+    def render(self, page, asgard_file, output_format):
+        sources = self.page_sources(page, asgard_file)
+        key = (page, output_format, sources)
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            rendering = key in self.renders
+            if not rendering:
+                self.renders[key] = concurrent.futures.Future()
+            future = self.renders[key]
+        if rendering:
+            return future.result()
+        try:
+            body = self.render_page(page, asgard_file, output_format, sources)
+            future.set_result(body)
+            return body
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.cache_lock:
+                del self.renders[key]
+
+    def render_page(self, page, asgard_file, output_format, sources):
+        inputs = self.page_inputs(page, asgard_file, sources)
+        report = MemoryReport()
+        add_page, page_inputs = PAGES[page]
+        add_page(report, *[inputs[name] for name in page_inputs])
+        report.close()
+        if output_format == "json":
+            body = json.dumps(report.rows, default=json_scalar).encode()
+        else:
+            body = render_html(page, report.rows).encode()
+        with self.cache_lock:
+            self.cache[(page, output_format, sources)] = body
+            while len(self.cache) > self.cache_pages:
+                self.cache.popitem(last=False)
+        return body
+
+    def index(self):
+        links = []
+        for week in sorted(self.week_files(), reverse=True):
+            pages = " ".join(f'<a href="/{week}/{page}.html">{page}</a> (<a href="/{week}/{page}.json">json</a>)' for page in self.pages)
+            links.append(f"<li>{html.escape(week)}: {pages}</li>")
+        return f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Asgard reports</title></head><body><ul>{''.join(links)}</ul></body></html>"
+
+def render_html(title, worksheets):
+    """
+    A page's worksheets as HTML tables, with the first row of each as the header.
+    """
+    def cells(row, tag):
+        return "".join(f"<{tag}>{'' if value is None else html.escape(str(value))}</{tag}>" for value in row)
+    body = []
+    for name, rows in worksheets.items():
+        body.append(f"<h2>{html.escape(name)}</h2><table border=\"1\">")
+        for row_id, row in enumerate(rows):
+            body.append(f"<tr>{cells(row, 'th' if row_id == 0 else 'td')}</tr>")
+        body.append("</table>")
+    return f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head><body>{''.join(body)}</body></html>"
+
+def serve_reports(shared_inputs, pages):
+    # http.server is slow to import, so only --serve pays for it
+    import http.server
+    import urllib.parse
+
+    class ReportRequestHandler(http.server.BaseHTTPRequestHandler):
+        """
+        / lists the weeks, /$WEEK/$PAGE.html and /$WEEK/$PAGE.json are the pages,
+        where $WEEK is a history file's name without .json.
+        """
+        def do_GET(self):
+            report_server = self.server.report_server
+            path = urllib.parse.urlparse(self.path).path.strip("/")
+            if path == "":
+                return self.respond(200, "text/html; charset=utf-8", report_server.index().encode())
+            week, _, page_file = path.partition("/")
+            page, extension = os.path.splitext(page_file)
+            asgard_file = report_server.week_files().get(week)
+            if asgard_file is None or page not in report_server.pages or extension not in [".html", ".json"]:
+                return self.respond(404, "text/plain; charset=utf-8", f"No page {self.path}\n".encode())
+            try:
+                body = report_server.render(page, asgard_file, extension[1:])
+            except Exception as e:
+                self.log_error("%s: %r", self.path, e)
+                return self.respond(500, "text/plain; charset=utf-8", f"{e}\n".encode())
+            self.respond(200, "application/json" if extension == ".json" else "text/html; charset=utf-8", body)
+
+        def respond(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class ThreadPoolHTTPServer(http.server.HTTPServer):
+        """
+        HTTPServer that answers requests on a fixed pool of threads, rather than
+        ThreadingHTTPServer's new thread per request.
+        """
+        def __init__(self, server_address, handler_class, max_workers):
+            super().__init__(server_address, handler_class)
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        def process_request(self, request, client_address):
+            self.executor.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown()
+
+    args = shared_inputs.args
+    # Lazy imports aren't thread safe, so finish the ones requests can use before the pool starts
+    for module in [numpy, yaml, tempfile, html, sqlite3]:
+        module.__name__
+    server = ThreadPoolHTTPServer(("127.0.0.1", args.serve), ReportRequestHandler, args.serve_threads)
+    server.report_server = ReportServer(shared_inputs, pages, args.serve_cache_pages)
+    print(f"Serving reports on http://127.0.0.1:{server.server_port}/")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def main():
+    args = parser.parse_args()
+    if args.asgard_file is None and args.batch is None and args.guilds is None and not args.watch and args.serve is None:
+        parser.error("an asgard_file, --batch, --guilds, --watch or --serve is required")
+    pages = parse_pages(args.pages)
+    if args.profile:
+        check_profile_file(args.profile_file)
+        enable_profiling()
+    with profile_stage("main"):
+        shared_inputs = ReportInputs(args)
+        if args.batch is not None:
+            with profile_stage("convert_batch"):
+                convert_batch(sorted(glob.glob(args.batch)), args, shared_inputs, pages)
+        if args.guilds is not None:
+            with profile_stage("convert_guilds"):
+                convert_guilds(read_guild_manifest(args.guilds), args, shared_inputs, pages)
+        if args.asgard_file is not None:
+            print(f"Asgard file: {args.asgard_file}")
+            convert_json_to_xlsx(ReportInputs(args, args.asgard_file, **shared_inputs.values), pages, args.output_format)
+        if args.serve is not None:
+            try:
+                serve_reports(shared_inputs, pages)
+            except KeyboardInterrupt:
+                pass
+        if args.watch:
+            try:
+                watch_history(shared_inputs, pages)
+            except KeyboardInterrupt:
+                pass
+    if args.profile:
+        write_profile(args.profile_file)
+
+if __name__ == "__main__":
+    main()
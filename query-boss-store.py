@@ -0,0 +1,102 @@
+#!/usr/bin/env nix-shell
+#! nix-shell -i python3 -p python3 python3Packages.XlsxWriter python3Packages.numpy python3Packages.pyyaml
+
+# Looks up boss matches in the SQLite match store that parse-boss-json.py
+# fills with --store, e.g. every Keira match at difficulty 140 or above
+# with Jumpstart:
+#
+#   ./query-boss-store.py --hero Keira --min_difficulty 140 --buff Jumpstart
+
+import csv
+import json
+import sys
+import glob
+import argparse
+import yaml
+import parse_boss_json
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--store', type=str, help='SQLite match store to query', default='cache/asgard.sqlite')
+parser.add_argument('--ingest', type=str, help='file glob of Asgard files to add to the store before querying')
+parser.add_argument('--guild_file', type=str, help='file containing guild data JSON, for --ingest', default='data/guild.json')
+parser.add_argument('--heroes_file', type=str, help='file containing hero and pet data', default='data/heroes.yaml')
+parser.add_argument('--buff_file', type=str, help='file containing buff data, for --ingest', default='data/asgard-buffs.yaml')
+parser.add_argument('--cache_dir', type=str, help='directory holding the parsed match table of each Asgard file, for --ingest', default='cache')
+parser.add_argument('--hero', type=str, action='append', default=[], help='only matches with this hero or pet in the team; may be repeated')
+parser.add_argument('--buff', type=str, action='append', default=[], help='only matches with this buff, by in-game name; may be repeated')
+parser.add_argument('--player', type=str, help='only matches of this player, by name or id')
+parser.add_argument('--week', type=str, help='only matches of the week ending on this YYYY-MM-DD date')
+parser.add_argument('--min_difficulty', type=int, help='only matches at this boss difficulty or above')
+parser.add_argument('--max_difficulty', type=int, help='only matches at this boss difficulty or below')
+parser.add_argument('--limit', type=int, help='print at most this many matches')
+
+
+def attacker_name(hero_data, hero_id):
+    if hero_id >= parse_boss_json.PET_ID_START:
+        return parse_boss_json.lookup_pet(hero_data, hero_id)
+    return parse_boss_json.lookup_hero(hero_data, hero_id)
+
+def attacker_id(hero_data, name):
+    if name in hero_data["heroes"]:
+        return hero_data["heroes"].index(name)
+    if name in hero_data["pets"]:
+        return parse_boss_json.PET_ID_START + hero_data["pets"].index(name)
+    parser.error(f"unknown hero or pet {name}")
+
+def query_matches(store, hero_data, args):
+    """
+    Filters become indexed lookups: difficulty, player and week on matches,
+    heroes on attackers and buffs on buffs.
+    """
+    conditions = []
+    params = []
+    for name in args.hero:
+        conditions.append("m.match_id IN (SELECT match_id FROM attackers WHERE hero_id = ?)")
+        params.append(attacker_id(hero_data, name))
+    for name in args.buff:
+        conditions.append("m.match_id IN (SELECT match_id FROM buffs WHERE name = ?)")
+        params.append(name)
+    if args.player is not None:
+        # Names can be all digits too, so try both
+        conditions.append("(m.player_id = ? OR m.player_id IN (SELECT player_id FROM players WHERE name = ?))")
+        params += [args.player, args.player]
+    if args.week is not None:
+        conditions.append("w.week = ?")
+        params.append(args.week)
+    if args.min_difficulty is not None:
+        conditions.append("m.difficulty >= ?")
+        params.append(args.min_difficulty)
+    if args.max_difficulty is not None:
+        conditions.append("m.difficulty <= ?")
+        params.append(args.max_difficulty)
+    query = """
+        SELECT m.match_id, w.week, m.player_id, p.name, m.difficulty, m.damage_taken + m.damage_taken_next_level AS damage
+        FROM matches m JOIN weeks w USING (week_id) LEFT JOIN players p USING (player_id)"""
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY w.week, damage DESC"
+    if args.limit is not None:
+        query += f" LIMIT {int(args.limit)}"
+    return store.execute(query, params).fetchall()
+
+def main():
+    args = parser.parse_args()
+    with open(args.heroes_file) as f:
+        hero_data = yaml.safe_load(f)
+    store = parse_boss_json.open_match_store(args.store)
+    if args.ingest is not None:
+        with open(args.guild_file) as f:
+            guild_roster = parse_boss_json.GuildRoster(json.load(f))
+        with open(args.buff_file) as f:
+            buff_data = parse_boss_json.compile_buff_data(yaml.safe_load(f))
+        history = parse_boss_json.dedup_history(sorted(glob.glob(args.ingest)), args.cache_dir)
+        parse_boss_json.ingest_history(store, history, args.cache_dir, guild_roster, buff_data)
+    writer = csv.writer(sys.stdout, delimiter="\t")
+    writer.writerow(["Week", "Player", "Difficulty", "Damage", "Team", "Buffs", "Match"])
+    for match_id, week, player_id, player_name, difficulty, damage in query_matches(store, hero_data, args):
+        team = [attacker_name(hero_data, hero_id) for hero_id, in store.execute("SELECT hero_id FROM attackers WHERE match_id = ? ORDER BY slot", (match_id,))]
+        buffs = [name or buff_id for buff_id, name in store.execute("SELECT buff_id, name FROM buffs WHERE match_id = ? ORDER BY slot", (match_id,))]
+        writer.writerow([week, player_name or player_id, difficulty, damage, ", ".join(team), ", ".join(buffs), match_id])
+
+if __name__ == "__main__":
+    main()